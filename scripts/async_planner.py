@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2017, Lars Niklasson
+Copyright (c) 2017, Filip Slottner Seholm
+Copyright (c) 2017, Fanny Sandblom
+Copyright (c) 2017, Kevin Hoogendijk
+Copyright (c) 2017, Nils Andren
+Copyright (c) 2017, Alicia Gil Martin
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the Chalmers University of Technology nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+from planner_service import *
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+
+# For serving reference path requests from an asyncio event loop
+#
+# Each request returns an asyncio Future right away, and the searches run on the executor of a PlanningService
+# Requests that snap to the same Nodes as a request which is still running (e.g. many trucks asking for
+# the same route when a shift starts) are merged onto that request, instead of searching again
+# Every request gets its own copy of the result
+class AsyncPlanner:
+
+    # Takes a PlanningService to run the searches on (optional, a new one is created if Not given),
+    # and an event loop (optional, the current event loop is used if Not given)
+    def __init__(self, service=None, loop=None):
+        self.service = service if service else PlanningService()
+        self.loop = loop if loop else asyncio.get_event_loop()
+
+        # Futures of the running searches, by key (see getRefPath() and getAltPaths())
+        self.in_flight = dict()
+        # Increased on every Obstacle change, so that new requests are Not merged onto searches started before it
+        self.version = 0
+
+        self.requests = 0
+        self.merged = 0
+
+
+    # Takes a VehicleState object, and an array of tuples of (x, y)-coordinates, assumed to be in cm
+    #
+    # Returns an asyncio Future for the result of RefPath.getRefPath() for the given parameters
+    def getRefPath(self, vehicle_state, pts):
+        graph = self.service.graph
+        compact = graph.getCompact()
+
+        # The reference path only depends on the Nodes that the vehicle and the given points are snapped to
+        start = getClosestToVehicle(graph, vehicle_state)
+        start = compact.getId(start) if start else None
+        ids = getClosestIds(compact, [p[0] for p in pts], [p[1] for p in pts], SNAP_RANGE)
+        key = ('path', self.version, start, tuple(ids.tolist()))
+
+        future = self.coalesce(key, self.service.planRefPath, vehicle_state, list(pts))
+        return self.copyResult(future, lambda result: (list(result[0]), list(result[1])))
+
+
+    # Takes a path (as returned by getRefPath()),
+    # indexes for the start resp. end point, for the segment which should be replaced,
+    # and the largest allowed overlap between the alternative paths (optional, see RefPath.getAltPaths())
+    #
+    # Returns an asyncio Future for the result of RefPath.getAltPaths() for the given parameters
+    def getAltPaths(self, path, start_index, end_index, max_overlap=None):
+        try:
+            start_point = Point(*path[start_index])
+            end_point = Point(*path[end_index])
+        except IndexError:
+            return self.copyResult(None, None)
+
+        # The alternative paths only depend on the start and end point, so the search is made for a path
+        # of only those two points, and the rest of the path is added afterwards, for each request
+        key = ('alt', self.version, (start_point.x, start_point.y), (end_point.x, end_point.y), max_overlap)
+        segment = [path[start_index], path[end_index]]
+        future = self.coalesce(key, planAltPaths, self.service.graph, segment, 0, 1, self.service.cache, max_overlap)
+
+        def splice(alt_paths):
+            return [path[:start_index] + alt + path[end_index+1:] for alt in alt_paths]
+        return self.copyResult(future, splice)
+
+
+    # Takes an Index value for an Obstacle, and a Boolean (True to activate, False to deactivate)
+    # Same as RefPath.setObstacle()
+    def setObstacle(self, index, active):
+        self.version += 1
+        return self.service.setObstacle(index, active)
+
+
+    # Takes an Index value for an Obstacle
+    # Same as RefPath.toggleObstacle()
+    def toggleObstacle(self, index):
+        self.version += 1
+        return self.service.toggleObstacle(index)
+
+
+    # Returns a Dictionary with the number of requests, and the number of them that were merged onto running searches
+    def getStats(self):
+        return {'requests': self.requests, 'merged': self.merged, 'in_flight': len(self.in_flight)}
+
+
+    # Takes a key, a function and its arguments
+    #
+    # If a search with given key is running:
+    #     Returns its Future
+    # Otherwise:
+    #     Returns the Future of a new search, calling the function on the executor of the PlanningService
+    def coalesce(self, key, function, *args):
+        self.requests += 1
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.merged += 1
+            return future
+
+        future = self.loop.run_in_executor(self.service.executor, function, *args)
+        self.in_flight[key] = future
+        future.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        return future
+
+
+    # Takes a Future (or None for a result that is already known to be None),
+    # and a function which copies its result (None if the result should Not be copied)
+    #
+    # Returns a new Future, which gets the copied result (or the exception) of the given Future
+    # (cancelling it does Not cancel the given Future, which may be shared with other requests)
+    def copyResult(self, future, copy):
+        result = asyncio.Future(loop=self.loop)
+        if future is None:
+            result.set_result(None)
+            return result
+
+        def done(future):
+            if result.cancelled():
+                return
+            if future.cancelled():
+                result.cancel()
+            elif future.exception() is not None:
+                result.set_exception(future.exception())
+            else:
+                value = future.result()
+                result.set_result(copy(value) if copy and value is not None else value)
+
+        future.add_done_callback(done)
+        return result
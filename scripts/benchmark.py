@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2017, Lars Niklasson
+Copyright (c) 2017, Filip Slottner Seholm
+Copyright (c) 2017, Fanny Sandblom
+Copyright (c) 2017, Kevin Hoogendijk
+Copyright (c) 2017, Nils Andren
+Copyright (c) 2017, Alicia Gil Martin
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the Chalmers University of Technology nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+from shortest_path import *
+from map_func import Map, readImgToMatrix, IMG_PATH
+from ref_path import VehicleState, GRAPH_PATH
+
+import argparse
+import json
+import platform
+import random
+import resource
+import sys
+import time
+from multiprocessing import Process, Pipe
+from math import pi
+
+
+SIZES = [1000, 10000, 100000]   # Default sizes (number of Nodes) of the generated Graphs, up to 1000000 works
+SAMPLES = 200                   # Default number of timed calls per benchmark
+K = 10                          # Number of paths asked for from kShortestPaths()
+K_RANGE = 1000                  # Maximum distance (in cm) between start and end point for kShortestPaths()
+
+SPACING = 200                   # Distance (in cm) between neighbouring Nodes in the generated Graphs
+JITTER = 40                     # Maximum random offset (in cm) of the Nodes in the generated Graphs
+DROP = 0.1                      # Share of the roads between neighbouring Nodes which are left out
+
+BASELINE_PATH = '/benchmark_baseline.json'
+TOLERANCE = 0.25                # Allowed relative increase of p90 latency and peak memory, compared to the baseline
+MIN_DELTA_MS = 0.05             # Latency increases below this (in ms) are never counted as regressions
+
+
+# Takes a number of Nodes, and a seed for the random generator (optional)
+#
+# Generates a road-like Graph: a grid of Nodes with random offsets,
+# where neighbouring Nodes are connected by two-way roads (an edge in each direction),
+# and a share of the roads is left out
+# The arrays are built directly, so Graphs with millions of Nodes can be made in seconds
+#
+# Returns a Graph object (with only a CompactGraph, see Graph.__init__())
+def makeRoadGraph(n, seed=0):
+    rng = np.random.RandomState(seed)
+    cols = int(np.ceil(np.sqrt(n)))
+    ids = np.arange(n)
+    (rows_of, cols_of) = (ids // cols, ids % cols)
+
+    xs = cols_of * float(SPACING) + rng.uniform(-JITTER, JITTER, n)
+    ys = rows_of * float(SPACING) + rng.uniform(-JITTER, JITTER, n)
+
+    # Roads to the right and downwards neighbours
+    right = ids[(cols_of < cols - 1) & (ids + 1 < n)]
+    down = ids[ids + cols < n]
+    sources = np.concatenate([right, down])
+    targets = np.concatenate([right + 1, down + cols])
+    keep = rng.uniform(size=len(sources)) >= DROP
+    (sources, targets) = (sources[keep], targets[keep])
+
+    # Both directions, sorted by the Node the edge goes from
+    (sources, targets) = (np.concatenate([sources, targets]), np.concatenate([targets, sources]))
+    order = np.lexsort((targets, sources))
+    (sources, targets) = (sources[order], targets[order])
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=n), out=offsets[1:])
+
+    return Graph(compact=CompactGraph(xs, ys, offsets, targets))
+
+
+# Takes an array of durations (in seconds)
+#
+# Returns a Dictionary with the number of durations, and their mean, percentiles and maximum (in ms)
+def getPercentiles(samples):
+    if not samples:
+        return {'count': 0}
+
+    ms = np.asarray(samples) * 1000.0
+    return {'count': len(samples), 'mean_ms': float(ms.mean()), 'p50_ms': float(np.percentile(ms, 50)),
+            'p90_ms': float(np.percentile(ms, 90)), 'p99_ms': float(np.percentile(ms, 99)), 'max_ms': float(ms.max())}
+
+
+# Takes a function, and an array of tuples of arguments
+#
+# Calls the function with each tuple of arguments
+#
+# Returns an array with the duration (in seconds) of each call
+def timeCalls(function, args_list):
+    samples = []
+    for args in args_list:
+        start = time.time()
+        function(*args)
+        samples.append(time.time() - start)
+    return samples
+
+
+# Takes a Graph, a number of pairs, a random generator,
+# and the maximum distance between the Nodes of a pair (optional)
+#
+# Returns an array of tuples of (start Node id, end Node id)
+def getPairs(graph, count, rng, max_dist=None):
+    compact = graph.getCompact()
+    n = compact.size()
+    pairs = []
+    while len(pairs) < count:
+        start = rng.randrange(n)
+        if max_dist is None:
+            end = rng.randrange(n)
+        else:
+            near = compact.getSpatialIndex().inRadius(compact.xs[start], compact.ys[start], max_dist)
+            end = rng.choice(near)
+        if start != end:
+            pairs.append((start, end))
+    return pairs
+
+
+# Takes the name of a Graph ('graph.txt' or 'road-<number of Nodes>')
+# Returns the Graph
+def getGraph(name):
+    if name == GRAPH_PATH[1:]:
+        return loadGraph(GRAPH_PATH)
+    return makeRoadGraph(int(name.split('-')[1]))
+
+
+# The benchmarks, each takes the name of a Graph (None for the ones that do Not use a Graph) and a number of samples,
+# and returns an array with the duration (in seconds) of each timed call
+
+def benchReadGraph(_, samples):
+    return timeCalls(readFileToGraph, [(GRAPH_PATH,)] * max(samples // 20, 3))
+
+
+def benchReadImg(_, samples):
+    return timeCalls(readImgToMatrix, [(IMG_PATH,)] * max(samples // 20, 3))
+
+
+def benchMapObstacle(_, samples):
+    track = Map()
+    durations = []
+    for i in range(samples):
+        index = i % len(track.obstacles)
+        durations += timeCalls(track.addObstacle, [(index,)])
+        durations += timeCalls(track.removeObstacle, [(index,)])
+    return durations
+
+
+def benchShortestPath(name, samples):
+    graph = getGraph(name)
+    compact = graph.getCompact()
+    pairs = getPairs(graph, samples, random.Random(1))
+    points = [(graph, Point(compact.xs[s], compact.ys[s]), Point(compact.xs[e], compact.ys[e])) for (s, e) in pairs]
+    shortestPath(*points[0])
+    return timeCalls(shortestPath, points)
+
+
+def benchKShortestPaths(name, samples):
+    graph = getGraph(name)
+    pairs = getPairs(graph, max(samples // 10, 5), random.Random(2), K_RANGE)
+    nodes = [(graph.getNodeById(s), graph.getNodeById(e), K) for (s, e) in pairs]
+    return timeCalls(kShortestPaths, [(graph,) + args for args in nodes])
+
+
+def benchClosestToVehicle(name, samples):
+    graph = getGraph(name)
+    compact = graph.getCompact()
+    rng = random.Random(3)
+    states = []
+    for _ in range(samples):
+        i = rng.randrange(compact.size())
+        states.append((graph, VehicleState(compact.xs[i] + rng.uniform(-50, 50), compact.ys[i] + rng.uniform(-50, 50),
+                                           rng.uniform(-pi, pi), 0)))
+    getClosestToVehicle(*states[0])
+    return timeCalls(getClosestToVehicle, states)
+
+
+BENCHMARKS = [
+    ('read_graph', benchReadGraph, False),
+    ('read_img', benchReadImg, False),
+    ('map_obstacle', benchMapObstacle, False),
+    ('shortest_path', benchShortestPath, True),
+    ('k_shortest_paths', benchKShortestPaths, True),
+    ('closest_to_vehicle', benchClosestToVehicle, True)
+]
+
+
+# Takes a benchmark function, the name of a Graph, a number of samples, and the sending end of a Pipe
+# Runs the benchmark (in a child process) and sends its percentiles, with the peak memory use of the process
+# (or the error, if the benchmark failed)
+def runBenchmark(function, graph_name, samples, connection):
+    try:
+        result = getPercentiles(function(graph_name, samples))
+        # The largest resident set size of the process, in kB on Linux
+        result['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except Exception as error:
+        result = {'error': repr(error)}
+    connection.send(result)
+    connection.close()
+
+
+# Takes an array of sizes for the generated Graphs, and a number of samples
+#
+# Runs every benchmark in its own process, so that the peak memory use is measured per benchmark
+#
+# Returns a Dictionary with the results by name ('<benchmark>' or '<benchmark>/<Graph name>')
+def runSuite(sizes, samples):
+    graph_names = [GRAPH_PATH[1:]] + ['road-%d' % size for size in sizes]
+    results = {}
+
+    for (name, function, uses_graph) in BENCHMARKS:
+        for graph_name in (graph_names if uses_graph else [None]):
+            key = name + ('/' + graph_name if graph_name else '')
+            (receiver, sender) = Pipe(False)
+            process = Process(target=runBenchmark, args=(function, graph_name, samples, sender))
+            process.start()
+            results[key] = receiver.recv()
+            process.join()
+
+            if 'error' in results[key]:
+                sys.stderr.write("%-40s failed: %s\n" % (key, results[key]['error']))
+            else:
+                sys.stderr.write("%-40s p50 %9.3f ms  p90 %9.3f ms  peak %8d kB\n"
+                                 % (key, results[key].get('p50_ms', 0), results[key].get('p90_ms', 0),
+                                    results[key]['peak_rss_kb']))
+
+    return results
+
+
+# Takes Dictionaries with the results of runSuite() and the baseline results, and the allowed relative increase
+#
+# Returns an array of descriptions of the results which are worse than the baseline (p90 latency or peak memory)
+def getRegressions(results, baseline, tolerance):
+    regressions = []
+    for key in sorted(results):
+        if key not in baseline:
+            continue
+        (new, old) = (results[key], baseline[key])
+
+        if 'error' in new:
+            regressions.append("%s: %s" % (key, new['error']))
+            continue
+        if 'error' in old:
+            continue
+
+        if 'p90_ms' in new and 'p90_ms' in old:
+            if new['p90_ms'] > old['p90_ms'] * (1 + tolerance) and new['p90_ms'] - old['p90_ms'] > MIN_DELTA_MS:
+                regressions.append("%s: p90 %.3f ms (baseline %.3f ms)" % (key, new['p90_ms'], old['p90_ms']))
+
+        if new['peak_rss_kb'] > old['peak_rss_kb'] * (1 + tolerance):
+            regressions.append("%s: peak memory %d kB (baseline %d kB)" % (key, new['peak_rss_kb'], old['peak_rss_kb']))
+
+    return regressions
+
+
+def main():
+    dirpath = dirname(abspath(__file__))
+    parser = argparse.ArgumentParser(description="Benchmarks for the planner, on 'graph.txt', 'map.png' and generated Graphs")
+    parser.add_argument('--sizes', default=','.join(str(size) for size in SIZES),
+                        help="comma-separated numbers of Nodes for the generated Graphs")
+    parser.add_argument('--samples', type=int, default=SAMPLES, help="number of timed calls per benchmark")
+    parser.add_argument('--output', help="file to store the results in (JSON)")
+    parser.add_argument('--baseline', default=dirpath + BASELINE_PATH, help="file with the baseline results (JSON)")
+    parser.add_argument('--save-baseline', action='store_true', help="store the results as the new baseline")
+    parser.add_argument('--no-compare', action='store_true', help="only report the results, without a baseline")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help="allowed relative increase of p90 latency and peak memory")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    report = {'python': platform.python_version(), 'machine': platform.machine(), 'sizes': sizes,
+              'samples': args.samples, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'results': runSuite(sizes, args.samples)}
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            file.write(text + '\n')
+        sys.stderr.write("Baseline stored in '%s'\n" % args.baseline)
+        return 0
+
+    if args.no_compare:
+        return 0
+
+    # Without a baseline nothing can be checked, which is an error rather than a pass
+    if not exists(args.baseline):
+        sys.stderr.write("No baseline in '%s' (store one with --save-baseline, or use --no-compare)\n" % args.baseline)
+        return 2
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)['results']
+
+    if not set(report['results']) & set(baseline):
+        sys.stderr.write("The baseline in '%s' has none of the benchmarks that were run\n" % args.baseline)
+        return 2
+
+    regressions = getRegressions(report['results'], baseline, args.tolerance)
+    for regression in regressions:
+        sys.stderr.write("REGRESSION %s\n" % regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
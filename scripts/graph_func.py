@@ -30,14 +30,27 @@ ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
 (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
-from os.path import dirname, abspath
+from os.path import dirname, abspath, exists
+from tempfile import mkstemp
+import os
+from hashlib import sha1
+from zlib import crc32
+import struct
 from math import sqrt, radians, degrees, ceil
 from enum import Enum
+from spatial_index import SpatialIndex, HeadingIndex
+import numpy as np
 import matplotlib.pyplot as plt
 
 
 SCALE = 10  # Savefile is in mm, and Graph in cm
 
+# Binary Graph savefile, see saveGraphToBinaryFile()
+BINARY_MAGIC = b'TMGRAPH\0'
+BINARY_VERSION = 2
+# Magic, version, flags, number of Nodes, number of edges, checksum, size and SHA-1 of the text file it was made from
+BINARY_HEADER = struct.Struct('<8sIIQQIQ20s')
+BINARY_HEADER_SIZE = 64
 
 # For representing a Point in a coordinate system
 class Point:
@@ -57,9 +70,48 @@ class Point:
 # For representing a Directed Graph
 class Graph:
 
-    # Takes a Dictionary of Node objects, which make up the Graph (optional)
-    def __init__(self, nodes=None):
-        self.nodes = nodes if nodes else dict()
+    # Takes a Dictionary of Node objects, which make up the Graph (optional),
+    # or a CompactGraph which makes up the Graph (optional)
+    #
+    # When a CompactGraph is given, the Node objects are only created when they are first used
+    def __init__(self, nodes=None, compact=None):
+
+        # Incremented on every change to this Graph or its Nodes,
+        # used to detect when the cached CompactGraph no longer matches the Graph
+        self.edits = 0
+
+        # CompactGraph built from this Graph, see getCompact()
+        self.compact = None
+        self.compact_edits = None
+
+        # RouteOracle used by shortestPath(), see 'route_oracle'
+        self.oracle = None
+
+        if compact is not None and not nodes:
+            self.compact = compact
+            self.compact_edits = self.edits
+        else:
+            self.nodes = nodes if nodes else dict()
+            for node in self.nodes.values():
+                node.addGraph(self)
+
+
+    # Only called for attributes which have not been set,
+    # used to create the Node objects of a Graph that was given as a CompactGraph on first use
+    def __getattr__(self, name):
+        if name != 'nodes' or self.compact is None:
+            raise AttributeError(name)
+
+        self.setNodes(nodesFromCompact(self.compact))
+        return self.nodes
+
+
+    # Takes a Dictionary of Node objects, by (x, y)-coordinates, created from the CompactGraph of this Graph
+    # Sets them as the Nodes of this Graph (which is Not counted as a change)
+    def setNodes(self, nodes):
+        self.nodes = nodes
+        for node in nodes.values():
+            node.addGraph(self)
 
 
     # String representation of a Graph object
@@ -91,6 +143,8 @@ class Graph:
                 current_node.addOutEdge(e)
         else:
             self.nodes[(node.x, node.y)] = node
+            node.addGraph(self)
+            self.edits += 1
 
 
     # Takes (x, y)-coordinates for a Node
@@ -103,10 +157,28 @@ class Graph:
         return self.nodes.get((x, y))
 
 
-    # For resetting the parameters used by shortestPath()
-    def resetGraph(self):
-        for node in self.nodes.values():
-            node.count = 0
+    # Takes a Node id (as used in the CompactGraph of this Graph)
+    # Returns the Node object with given id
+    def getNodeById(self, i):
+        compact = self.getCompact()
+        if compact.nodes is None:
+            self.setNodes(nodesFromCompact(compact))
+        return compact.nodes[i]
+
+
+    # Returns a CompactGraph with the same Nodes and edges as this Graph
+    #
+    # The CompactGraph is built on first use and cached,
+    # it is rebuilt when Nodes or edges have been added to this Graph since (through addNode() or addOutEdge())
+    # The edges that were blocked in the old CompactGraph are also blocked in the new one
+    def getCompact(self):
+        if self.compact is None or self.compact_edits != self.edits:
+            old = self.compact
+            self.compact = compactGraph(self)
+            self.compact_edits = self.edits
+            if old is not None:
+                self.compact.copyBlocked(old)
+        return self.compact
 
 
 # For representing a Node in a Graph
@@ -118,9 +190,13 @@ class Node:
         self.x = x
         self.y = y
         self.out_edges = out_edges if out_edges else []
+        # Out-edges by (x, y)-coordinates, for constant time lookup in getOutEdge()
+        self.out_edge_map = dict(((node.x, node.y), node) for node in self.out_edges)
 
-        # For use in shortestPath()
-        self.count = 0
+        # Index of this Node in the CompactGraph of its Graph
+        self.id = None
+        # Graphs which this Node is part of, which are notified when an out-edge is added
+        self.graphs = []
 
 
     # String representation of a Node object
@@ -139,12 +215,26 @@ class Node:
         return self.x == other.x and self.y == other.y
 
 
+    # Hash value consistent with the equality above, so that Node objects can be used in Sets and as keys
+    def __hash__(self):
+        return hash((self.x, self.y))
+
+
     # Takes another Node object
     # Adds an outgoing edge from this Node to that Node (without creating duplicates)
     def addOutEdge(self, node):
         out_edge = self.getOutEdge(node.x, node.y)
         if not out_edge:
             self.out_edges.append(node)
+            self.out_edge_map[(node.x, node.y)] = node
+            for graph in self.graphs:
+                graph.edits += 1
+
+
+    # Takes a Graph object which this Node has been added to
+    def addGraph(self, graph):
+        if not any(g is graph for g in self.graphs):
+            self.graphs.append(graph)
 
 
     # Takes (x,y)-coordinates for a Node
@@ -154,12 +244,7 @@ class Node:
     # Otherwise:
     #     Reurns None 
     def getOutEdge(self, x, y):
-        for node in self.out_edges:
-            if node.x == x and node.y == y:
-                # Node object found
-                return node
-        # Node object Not found
-        return None
+        return self.out_edge_map.get((x, y))
 
 
     # Returns the length of an edge between this Node and the given Node object
@@ -167,10 +252,293 @@ class Node:
         return sqrt((to_node.x - self.x)**2 + (to_node.y - self.y)**2)
 
 
+# For representing a Directed Graph in compact form, where each Node is identified by a dense integer id
+#
+# Coordinates are stored in arrays 'xs' and 'ys', indexed by Node id
+# Edges are stored in CSR form: the out-edges of Node i are the edges offsets[i] to offsets[i+1]-1,
+# where edge e goes to Node targets[e] and has length lengths[e]
+class CompactGraph:
+
+    # Takes arrays with coordinates, CSR offsets and targets, and the edge lengths (optional)
+    # If the edge lengths are not given, they are computed from the coordinates
+    def __init__(self, xs, ys, offsets, targets, lengths=None):
+        self.xs = np.asarray(xs, dtype=np.float64)
+        self.ys = np.asarray(ys, dtype=np.float64)
+        self.offsets = np.asarray(offsets, dtype=np.int32)
+        self.targets = np.asarray(targets, dtype=np.int32)
+
+        if lengths is None:
+            sources = self.getSources()
+            lengths = np.hypot(self.xs[self.targets] - self.xs[sources], self.ys[self.targets] - self.ys[sources])
+        self.lengths = np.asarray(lengths, dtype=np.float64)
+
+        # Edges which may not be used by any search (e.g. because of an obstacle), see blockEdges()
+        # A new Set is created on every change, so a search can keep using the Set it started with
+        self.blocked = frozenset()
+        self.block_counts = dict()
+
+        # Node objects by id, when built from a Graph
+        self.nodes = None
+
+        # Python list copies of the arrays, see getLists()
+        self.lists = None
+        # In-edges in CSR form, see getReverseLists()
+        self.reverse_lists = None
+        # SearchScratch objects which are Not in use by any search, see acquireScratch()
+        self.free_scratch = []
+        # Node ids by (x, y)-coordinates, see getIdAt()
+        self.index = None
+        # SpatialIndex over the Node coordinates, see getSpatialIndex()
+        self.spatial_index = None
+        # HeadingIndex over the Nodes and their out-edges, see getHeadingIndex()
+        self.heading_index = None
+
+
+    # Returns the number of Nodes
+    def size(self):
+        return len(self.xs)
+
+
+    # Returns a tuple of Python lists (offsets, sources, edges) for the in-edges of all Nodes:
+    # the in-edges of Node i are 'edges[j]', going from Node 'sources[j]', for j from offsets[i] to offsets[i+1]-1
+    def getReverseLists(self):
+        if self.reverse_lists is None:
+            order = np.argsort(self.targets, kind='mergesort')
+            counts = np.bincount(self.targets, minlength=len(self.xs))
+            offsets = np.zeros(len(self.xs) + 1, dtype=np.int64)
+            np.cumsum(counts, out=offsets[1:])
+            self.reverse_lists = (offsets.tolist(), self.getSources()[order].tolist(), order.tolist())
+        return self.reverse_lists
+
+
+    # Returns an array with the id of the Node each edge goes from
+    def getSources(self):
+        return np.repeat(np.arange(len(self.xs), dtype=np.int32), np.diff(self.offsets))
+
+
+    # Takes an iterable with edge ids
+    #
+    # Blocks the given edges, keeping count of how many times each edge has been blocked
+    # (an edge stays blocked until it has been unblocked as many times)
+    #
+    # Returns an array with the edges that were not blocked before
+    def blockEdges(self, edges):
+        changed = []
+        for edge in edges:
+            count = self.block_counts.get(edge, 0)
+            self.block_counts[edge] = count + 1
+            if count == 0:
+                changed.append(edge)
+
+        if changed:
+            self.blocked = self.blocked.union(changed)
+        return changed
+
+
+    # Takes an iterable with edge ids
+    #
+    # Unblocks the given edges once (see blockEdges())
+    #
+    # Returns an array with the edges that are no longer blocked
+    def unblockEdges(self, edges):
+        changed = []
+        for edge in edges:
+            count = self.block_counts.get(edge, 0)
+            if count <= 1:
+                self.block_counts.pop(edge, None)
+                if count == 1:
+                    changed.append(edge)
+            else:
+                self.block_counts[edge] = count - 1
+
+        if changed:
+            self.blocked = self.blocked.difference(changed)
+        return changed
+
+
+    # Takes another CompactGraph (e.g. one built earlier from the same Graph)
+    # Blocks each edge between the same coordinates as a blocked edge of the other CompactGraph,
+    # as many times as that edge is blocked there (see blockEdges())
+    def copyBlocked(self, other):
+        sources = other.getSources()
+        for edge, count in other.block_counts.items():
+            (source, target) = (sources[edge], other.targets[edge])
+            new_edge = self.getEdgeBetween(other.xs[source], other.ys[source], other.xs[target], other.ys[target])
+            if new_edge is not None:
+                self.blockEdges([new_edge] * count)
+
+
+    # Unblocks all edges, however many times they have been blocked
+    def clearBlocked(self):
+        self.blocked = frozenset()
+        self.block_counts = dict()
+
+
+    # Takes (x, y)-coordinates for two Nodes
+    #
+    # If there is an edge from the first Node to the second Node:
+    #     Returns the id of that edge
+    # Otherwise:
+    #     Returns None
+    def getEdgeBetween(self, x1, y1, x2, y2):
+        (source, target) = (self.getIdAt(x1, y1), self.getIdAt(x2, y2))
+        if source is None or target is None:
+            return None
+        offsets, targets = self.getLists()[2:4]
+        for edge in range(offsets[source], offsets[source+1]):
+            if targets[edge] == target:
+                return edge
+        return None
+
+
+    # Takes a Node object
+    #
+    # If there is a Node with the same coordinates in this CompactGraph:
+    #     Returns the id of that Node
+    # Otherwise:
+    #     Returns None
+    def getId(self, node):
+        i = node.id
+        if self.nodes and i is not None and i < len(self.nodes) and self.nodes[i] is node:
+            return i
+        return self.getIdAt(node.x, node.y)
+
+
+    # Takes (x, y)-coordinates for a Node
+    #
+    # If there is a Node with given coordinates in this CompactGraph:
+    #     Returns the id of that Node
+    # Otherwise:
+    #     Returns None
+    def getIdAt(self, x, y):
+        if self.index is None:
+            xs, ys = self.getLists()[:2]
+            self.index = dict(((xs[i], ys[i]), i) for i in range(len(xs)))
+        return self.index.get((x, y))
+
+
+    # Returns a fingerprint (hex string) of the Nodes and edges,
+    # which is the same for two CompactGraphs exactly when they have the same Nodes (in the same order) and edges
+    def getFingerprint(self):
+        h = sha1()
+        for array in (self.xs, self.ys, self.offsets, self.targets):
+            h.update(np.ascontiguousarray(array).tobytes())
+        return h.hexdigest()
+
+
+    # Returns a SpatialIndex over the Node coordinates (built on first use)
+    def getSpatialIndex(self):
+        if self.spatial_index is None:
+            self.spatial_index = SpatialIndex(self.xs, self.ys)
+        return self.spatial_index
+
+
+    # Returns a HeadingIndex over the Nodes and their out-edges (built on first use)
+    def getHeadingIndex(self):
+        if self.heading_index is None:
+            self.heading_index = HeadingIndex(self.getSpatialIndex(), self.xs, self.ys, self.offsets, self.targets)
+        return self.heading_index
+
+
+    # Returns a tuple of Python lists (xs, ys, offsets, targets, lengths)
+    #
+    # The search loops in 'shortest_path' index single elements at a time,
+    # which is a lot faster on lists than on NumPy arrays
+    def getLists(self):
+        if self.lists is None:
+            self.lists = (self.xs.tolist(), self.ys.tolist(), self.offsets.tolist(),
+                          self.targets.tolist(), self.lengths.tolist())
+        return self.lists
+
+
+    # Returns a SearchScratch for one search on this CompactGraph, which is owned by that search until it is
+    # handed back with releaseScratch()
+    #
+    # Scratch objects are re-used between searches, and a new one is only allocated
+    # when all existing ones are in use (by searches running at the same time in other threads)
+    def acquireScratch(self):
+        try:
+            scratch = self.free_scratch.pop()
+        except IndexError:
+            scratch = SearchScratch(len(self.xs), self.getSources().tolist())
+        scratch.begin()
+        return scratch
+
+
+    # Takes a SearchScratch from acquireScratch(), which is no longer used by its search
+    def releaseScratch(self, scratch):
+        self.free_scratch.append(scratch)
+
+
+# Per-query search state: distance, parent edge, and whether the Node is done, indexed by Node id,
+# and the id of the Node each edge goes from (for following the parent edges back)
+#
+# An entry is only valid if its stamp equals the epoch of the current search,
+# so starting a new search (see begin()) takes constant time instead of clearing the arrays
+class SearchScratch:
+
+    # Takes the number of Nodes, and an array with the id of the Node each edge goes from
+    def __init__(self, size, sources):
+        self.sources = sources
+        self.dist = [0.0] * size
+        self.parent = [-1] * size
+        # Epoch in which 'dist' and 'parent' resp. 'done' were last set, for each Node
+        self.seen = [0] * size
+        self.done = [0] * size
+        self.epoch = 0
+
+
+    # Starts a new search, which invalidates all entries
+    def begin(self):
+        self.epoch += 1
+
+
+# Takes a Graph
+#
+# Assigns a dense integer id to each Node in the Graph (stored in Node.id)
+#
+# Returns a CompactGraph with the same Nodes and edges
+def compactGraph(graph):
+    nodes = list(graph.nodes.values())
+    for i, node in enumerate(nodes):
+        node.id = i
+
+    offsets = [0]
+    targets = []
+    for node in nodes:
+        for out_edge in node.out_edges:
+            # The out-edge may be a different Node object with the same coordinates (see addNode())
+            targets.append(graph.getNode(out_edge.x, out_edge.y).id)
+        offsets.append(len(targets))
+
+    compact = CompactGraph([node.x for node in nodes], [node.y for node in nodes], offsets, targets)
+    compact.nodes = nodes
+    return compact
+
+
+# Takes a CompactGraph
+#
+# Creates a Node object for each Node in the CompactGraph (stored in CompactGraph.nodes)
+#
+# Returns a Dictionary of the Node objects, by (x, y)-coordinates (as Graph.nodes)
+def nodesFromCompact(compact):
+    xs, ys, offsets, targets = compact.getLists()[:4]
+    nodes = [Node(xs[i], ys[i]) for i in range(len(xs))]
+
+    for i, node in enumerate(nodes):
+        node.id = i
+        node.out_edges = [nodes[j] for j in targets[offsets[i]:offsets[i+1]]]
+        node.out_edge_map = dict(((n.x, n.y), n) for n in node.out_edges)
+
+    compact.nodes = nodes
+    return dict(((node.x, node.y), node) for node in nodes)
+
+
 # Takes a path (relative to current directory), to a text file containing a Graph representation
 # (path='/graph.txt' for file 'graph.txt', located in current directory)
 #
 # The textfile should be in the format specified in 'example_graph.txt'
+# (a binary file created by saveGraphToBinaryFile() is also accepted, see readBinaryFileToGraph())
 #
 # The textfile is assumed to store Graph in mm
 # The Graph returned by this function is in cm
@@ -180,6 +548,11 @@ class Node:
 # Otherwise:
 #     Returns None
 def readFileToGraph(path):
+    dirpath = dirname(abspath(__file__))
+    with open(dirpath + path, 'rb') as file:
+        if file.read(len(BINARY_MAGIC)) == BINARY_MAGIC:
+            return readBinaryFileToGraph(path)
+
     graph = Graph()
     current_node = None
     dirpath = dirname(abspath(__file__))
@@ -305,6 +678,144 @@ def saveGraphToFile(graph, filename):
             file.write("ENDNODE\n\n")
 
 
+# Takes a Graph, a filename,
+# and the fingerprint of the text file the Graph was read from (optional, see getSourceFingerprint())
+# Stores the Graph data in a binary file with given filename (replacing an existing file as a whole),
+# which can be re-read (memory-mapped) by calling 'readBinaryFileToGraph(path_to_savefile)'
+#
+# The binary file stores the Graph in cm, as the arrays of its CompactGraph:
+#     Header (64 bytes): magic, version, flags, number of Nodes, number of edges, CRC-32 of the rest of the file,
+#     size and SHA-1 of the text file (0 and zeros if Not given)
+#     xs, ys (float64), offsets (int32), targets (int32), lengths (float64), each padded to a multiple of 8 bytes
+# All values are little-endian
+def saveGraphToBinaryFile(graph, filename, source=(0, b'')):
+    compact = graph.getCompact()
+    arrays = [compact.xs.astype('<f8'), compact.ys.astype('<f8'), compact.offsets.astype('<i4'),
+              compact.targets.astype('<i4'), compact.lengths.astype('<f8')]
+
+    payload = b''
+    for array in arrays:
+        data = array.tobytes()
+        payload += data + b'\0' * (-len(data) % 8)
+
+    header = BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, 0, compact.size(), len(compact.targets),
+                                crc32(payload) & 0xffffffff, source[0], source[1])
+
+    # Writing to a temporary file next to the binary file, which then replaces it in one step,
+    # so a process memory-mapping the old file, or starting at the same time, never sees a partial file
+    (handle, temp_path) = mkstemp(prefix='.graph-', suffix='.tmp', dir=dirname(abspath(filename)))
+    try:
+        with os.fdopen(handle, 'wb') as file:
+            file.write(header + b'\0' * (BINARY_HEADER_SIZE - len(header)))
+            file.write(payload)
+        os.rename(temp_path, filename)
+    except:
+        os.remove(temp_path)
+        raise
+
+
+# Takes a path (relative to current directory), to a binary file created by saveGraphToBinaryFile()
+# (path='/graph.bin' for file 'graph.bin', located in current directory),
+# a Boolean that decides if the checksum should be verified (optional),
+# and the fingerprint of the text file the binary file has to be made from (optional, see getSourceFingerprint())
+#
+# The arrays are memory-mapped (read-only) from the file, not read into memory,
+# so processes loading the same file share its pages
+#
+# If the file has a valid header (and checksum), and was made from the given text file:
+#     Returns a Graph object
+# Otherwise (also if the file is empty or can Not be read):
+#     Returns None
+def readBinaryFileToGraph(path, verify=True, source=None):
+    dirpath = dirname(abspath(__file__))
+    try:
+        data = np.memmap(dirpath + path, dtype=np.uint8, mode='r')
+    except (ValueError, IOError, OSError):
+        print "Invalid binary Graph file '%s'" % path
+        return None
+    return readBinaryDataToGraph(data, path, verify, source)
+
+
+# Takes an array of bytes (uint8) in the format of saveGraphToBinaryFile() (e.g. a memory-mapped file),
+# a name for the data to use in error messages, a Boolean that decides if the checksum should be verified (optional),
+# and the fingerprint of the text file the data has to be made from (optional, see getSourceFingerprint())
+#
+# The arrays of the returned Graph are views of the given array, not copies
+#
+# If the data has a valid header (and checksum), and was made from the given text file:
+#     Returns a Graph object
+# Otherwise:
+#     Returns None
+def readBinaryDataToGraph(data, path, verify=True, source=None):
+    if len(data) < BINARY_HEADER_SIZE:
+        print "Invalid binary Graph file '%s'" % path
+        return None
+
+    (magic, version, flags, n, e, checksum, source_size, source_hash) = \
+        BINARY_HEADER.unpack(data[:BINARY_HEADER.size].tobytes())
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        print "Invalid binary Graph file '%s'" % path
+        return None
+
+    if source is not None and (source_size, source_hash) != source:
+        print "Binary Graph file '%s' was Not made from the current Graph file" % path
+        return None
+
+    if verify and crc32(data[BINARY_HEADER_SIZE:]) & 0xffffffff != checksum:
+        print "Checksum error in '%s'" % path
+        return None
+
+    arrays = []
+    offset = BINARY_HEADER_SIZE
+    for (dtype, count) in (('<f8', n), ('<f8', n), ('<i4', n+1), ('<i4', e), ('<f8', e)):
+        size = np.dtype(dtype).itemsize * count
+        if offset + size > len(data):
+            print "Invalid binary Graph file '%s'" % path
+            return None
+        arrays.append(data[offset:offset+size].view(dtype))
+        offset += size + (-size % 8)
+
+    return Graph(compact=CompactGraph(*arrays))
+
+
+# Takes a path (relative to current directory), to a text file containing a Graph representation
+#
+# Reads the binary copy of the Graph file ('graph.bin' for 'graph.txt') if it was made from the current text file
+# (same size and SHA-1, so a restored older text file is never answered with a newer binary copy),
+# otherwise (also if the binary copy is empty, cut off or can Not be read) reads the text file,
+# and tries to store a new binary copy for the next time
+#
+# If the Graph could be read:
+#     Returns a Graph object
+# Otherwise:
+#     Returns None
+def loadGraph(path):
+    dirpath = dirname(abspath(__file__))
+    binary_path = path.rsplit('.', 1)[0] + '.bin'
+    source = getSourceFingerprint(dirpath + path)
+
+    if exists(dirpath + binary_path):
+        graph = readBinaryFileToGraph(binary_path, source=source)
+        if graph:
+            return graph
+
+    graph = readFileToGraph(path)
+    if graph:
+        try:
+            saveGraphToBinaryFile(graph, dirpath + binary_path, source)
+        except (IOError, OSError):
+            pass
+    return graph
+
+
+# Takes the full path to a file
+# Returns a tuple of (size in bytes, SHA-1 digest) of the file contents
+def getSourceFingerprint(filename):
+    with open(filename, 'rb') as file:
+        data = file.read()
+    return (len(data), sha1(data).digest())
+
+
 # Takes an array of Point objects
 #
 # The given points are assumed to be in mm
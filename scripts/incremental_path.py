@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2017, Lars Niklasson
+Copyright (c) 2017, Filip Slottner Seholm
+Copyright (c) 2017, Fanny Sandblom
+Copyright (c) 2017, Kevin Hoogendijk
+Copyright (c) 2017, Nils Andren
+Copyright (c) 2017, Alicia Gil Martin
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the Chalmers University of Technology nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+from shortest_path import aStar
+from heapq import heappush, heappop
+from math import sqrt
+
+
+INF = float('inf')
+EPSILON = 1e-6  # Largest difference (in cm) between two key components that are treated as equal
+
+
+# For repeatedly finding the shortest path to one goal Node, while the start Node moves and edges get blocked/unblocked
+#
+# D* Lite: the search runs backwards from the goal Node, and its state (g and rhs values, and the priority queue)
+# is kept between calls to getPath()
+# After an edge change, or when the start Node has moved, only the part of the search tree affected by the change is repaired
+#
+# g[u] is the current estimate of the distance from Node u to the goal,
+# rhs[u] is the one-step lookahead min(length of edge u->v + g[v]) over the out-edges of u
+# A Node is in the queue while g[u] != rhs[u]
+class IncrementalPlanner:
+
+    # Takes a CompactGraph and a Node id for the goal
+    def __init__(self, compact, goal):
+        self.compact = compact
+        self.goal = goal
+
+        self.g = dict()
+        self.rhs = {goal: 0}
+        self.km = 0
+        self.start = None
+
+        # Heap of (key, Node id), where entries with a key different from 'queued' are outdated
+        self.queue = []
+        self.queued = dict()
+
+        # Edges which have been blocked/unblocked since the last call to getPath()
+        self.changed_edges = set()
+
+        self.insert(goal, (self.heuristic(goal), 0))
+
+
+    # Takes a Node id for the start Node
+    #
+    # If the search state has a path, but it can Not be followed (which should Not happen),
+    # a message is printed and the path is searched for with A* instead
+    #
+    # If there is a path from the start Node to the goal Node:
+    #     Returns the shortest path as an array of Node ids, from the start Node to the goal Node
+    # Otherwise:
+    #     Returns None
+    def getPath(self, start):
+        if self.start is None:
+            self.start = start
+
+        # The keys of the queued Nodes are lower bounds relative to the previous start Node,
+        # increasing 'km' keeps them valid for the new start Node
+        elif start != self.start:
+            self.km += self.distance(self.start, start)
+            self.start = start
+
+        if self.changed_edges:
+            sources = self.compact.getSources()
+            for edge in self.changed_edges:
+                self.updateNode(int(sources[edge]))
+            self.changed_edges = set()
+
+        self.computeShortestPath()
+
+        # The whole reachable part of the Graph has been searched, so there is No path
+        if self.g.get(start, INF) == INF:
+            return None
+
+        path = self.followPath(start)
+        if path is None:
+            print "== ERROR: The incremental search state has No path from Node %s, searching with A* instead" % start
+            path = aStar(self.compact, start, self.goal)
+            path = [start] + [i for (i, _) in path] if path is not None else None
+        return path
+
+
+    # Takes a Node id for the start Node
+    #
+    # If the g values lead from the start Node to the goal Node:
+    #     Returns the path as an array of Node ids, from the start Node to the goal Node
+    # Otherwise:
+    #     Returns None
+    def followPath(self, start):
+        if self.g.get(start, INF) == INF:
+            return None
+
+        # Following the best out-edge from each Node to the goal
+        (offsets, targets, lengths) = self.compact.getLists()[2:]
+        blocked = self.compact.blocked
+        path = [start]
+        current = start
+        while current != self.goal and len(path) <= len(offsets):
+            best = None
+            best_cost = INF
+            for edge in range(offsets[current], offsets[current+1]):
+                if edge in blocked:
+                    continue
+                cost = lengths[edge] + self.g.get(targets[edge], INF)
+                if cost < best_cost:
+                    best_cost = cost
+                    best = targets[edge]
+            if best is None:
+                return None
+            path.append(best)
+            current = best
+
+        return path if current == self.goal else None
+
+
+    # Takes an iterable with ids of edges which have been blocked or unblocked
+    # The search is repaired around those edges on the next call to getPath()
+    def updateEdges(self, edges):
+        self.changed_edges.update(edges)
+
+
+    # Repairs the search until the start Node has its correct distance to the goal
+    def computeShortestPath(self):
+        (offsets, targets, lengths) = self.compact.getLists()[2:]
+        (in_offsets, in_sources, in_edges) = self.compact.getReverseLists()
+        blocked = self.compact.blocked
+        start = self.start
+
+        while self.queue:
+            (key, u) = self.queue[0]
+            if self.queued.get(u) != key:
+                heappop(self.queue)
+                continue
+
+            if not keyLess(key, self.getKey(start)) and self.rhs.get(start, INF) == self.g.get(start, INF):
+                break
+
+            heappop(self.queue)
+            del self.queued[u]
+
+            new_key = self.getKey(u)
+            (g_u, rhs_u) = (self.g.get(u, INF), self.rhs.get(u, INF))
+
+            if key < new_key:
+                self.insert(u, new_key)
+
+            # Locally overconsistent: u gets its final distance, its predecessors may improve
+            elif g_u > rhs_u:
+                self.g[u] = rhs_u
+                for j in range(in_offsets[u], in_offsets[u+1]):
+                    if in_edges[j] in blocked:
+                        continue
+                    v = in_sources[j]
+                    if v != self.goal:
+                        cost = lengths[in_edges[j]] + rhs_u
+                        if cost < self.rhs.get(v, INF):
+                            self.rhs[v] = cost
+                    self.updateQueue(v)
+
+            # Locally underconsistent: u's distance is unknown again, u and its predecessors need new lookaheads
+            else:
+                self.g[u] = INF
+                self.updateNode(u)
+                for j in range(in_offsets[u], in_offsets[u+1]):
+                    self.updateNode(in_sources[j])
+
+
+    # Takes a Node id
+    # Recomputes the rhs value of the Node from its out-edges, and updates its place in the queue
+    def updateNode(self, u):
+        if u != self.goal:
+            (offsets, targets, lengths) = self.compact.getLists()[2:]
+            blocked = self.compact.blocked
+            best = INF
+            for edge in range(offsets[u], offsets[u+1]):
+                if edge not in blocked:
+                    best = min(best, lengths[edge] + self.g.get(targets[edge], INF))
+            self.rhs[u] = best
+        self.updateQueue(u)
+
+
+    # Takes a Node id
+    # Queues the Node if it is inconsistent (g != rhs), otherwise removes it from the queue
+    def updateQueue(self, u):
+        if self.g.get(u, INF) != self.rhs.get(u, INF):
+            self.insert(u, self.getKey(u))
+        else:
+            self.queued.pop(u, None)
+
+
+    # Takes a Node id and a key
+    # Queues the Node with given key (replacing any earlier key)
+    def insert(self, u, key):
+        self.queued[u] = key
+        heappush(self.queue, (key, u))
+
+
+    # Takes a Node id
+    # Returns the priority of the Node in the queue
+    def getKey(self, u):
+        k = min(self.g.get(u, INF), self.rhs.get(u, INF))
+        return (k + self.heuristic(u) + self.km, k)
+
+
+    # Takes a Node id
+    # Returns the straight-line distance from the start Node to given Node (0 before the first call to getPath())
+    def heuristic(self, u):
+        if self.start is None:
+            return 0
+        return self.distance(self.start, u)
+
+
+    # Takes two Node ids
+    # Returns the straight-line distance between the Nodes
+    def distance(self, u, v):
+        (xs, ys) = self.compact.getLists()[:2]
+        return sqrt((xs[u] - xs[v])**2 + (ys[u] - ys[v])**2)
+
+
+# Takes two keys, as tuples of two numbers (see IncrementalPlanner.getKey())
+#
+# Compares the keys in lexicographic order, where components within EPSILON of each other are equal,
+# so that rounding errors in the sums can Not make a key look larger than it is
+#
+# Returns True if the first key is smaller than (or within EPSILON of) the second key
+def keyLess(a, b):
+    if a[0] < b[0] - EPSILON:
+        return True
+    if a[0] > b[0] + EPSILON:
+        return False
+    return a[1] < b[1] + EPSILON
@@ -35,11 +35,14 @@ import cv2
 import matplotlib.pyplot as plt
 from os.path import dirname, abspath
 from math import ceil
+from planner_stats import timedCall
 
 
 IMG_PATH = '/map.png'
 IMG_PATH_CENTERLINE = '/map_centerline.png'
 SCALE = 10  # Map img is in scale 1:10
+MAX_CLEARANCE = 50  # Largest distance (in cm) to a black element stored in the clearance layer
+INFLATION_RADIUS = 15  # Default radius (in cm) of a circle covering the cross-section of the truck
 
 
 # For representing an obstacle on the track
@@ -54,7 +57,6 @@ class Obstacle:
         self.height = height
         self.padding = padding
 
-        self.matrix_backup = []
         self.active = False
 
 
@@ -69,19 +71,44 @@ OBSTACLES = [
     ]
 
 
+# For representing the track, with obstacles
+#
+# 'matrix' is made up of three layers:
+#     'base' holds the values read from the Map image,
+#     'obstacle_count' holds the number of active Obstacles covering each element,
+#     'padding_count' holds the number of active Obstacle paddings covering each element
+# An element covered by an Obstacle is 0 (black), otherwise an element covered by a padding is 2 (grey),
+# otherwise it has its value from 'base'
+#
+# Since the layers are counters, Obstacles can overlap, and can be added and removed in any order
+#
+# 'clearance' holds the distance (in cm) from each element to the closest black element (at most MAX_CLEARANCE),
+# and 'inflated' is True for each element closer than 'inflation' to a black element,
+# i.e. where the center of the truck can Not be without hitting a wall or an Obstacle
+# Both are only recomputed around an Obstacle when it is added or removed
 class Map:
 
-    def __init__(self, centerline=False):
+    # Takes True to read the centerline Map image (optional),
+    # and the radius (in cm) of a circle covering the cross-section of the truck (optional, see setInflation())
+    def __init__(self, centerline=False, inflation=INFLATION_RADIUS):
         
         if centerline:
             path = IMG_PATH_CENTERLINE
         else:
             path = IMG_PATH
             
-        self.matrix = readImgToMatrix(path)
+        self.base = readImgToMatrix(path)
+        self.matrix = self.base.copy()  # NumPy array (uint8), indexed as matrix[y][x]
+        self.obstacle_count = np.zeros(self.base.shape, dtype=np.int16)
+        self.padding_count = np.zeros(self.base.shape, dtype=np.int16)
         self.scale = SCALE
         self.obstacles = OBSTACLES
 
+        self.clearance = getClearance(self.matrix)  # NumPy array (float32), indexed as clearance[y][x]
+        self.inflation = None
+        self.inflated = None
+        self.setInflation(inflation)
+
 
     def getMapAndScale(self):
         return (self.matrix, self.scale)
@@ -94,6 +121,7 @@ class Map:
     #     Returns True
     # If given index is out of bounds, or the corresponding Obstacle is already activated:
     #     Returns False
+    @timedCall('map.add_obstacle')
     def addObstacle(self, index):
 
         # Checking the validity of the given index
@@ -106,34 +134,7 @@ class Map:
         if obstacle.active:
             return False
 
-        height = int(ceil(obstacle.height))
-        width = int(ceil(obstacle.width))
-        padding = int(ceil(obstacle.padding))
-        (x, y) = (int(obstacle.x), int(obstacle.y))
-
-        # Going through all rows in the matrix
-        for i in range(height):
-            row = []
-
-            # Going through all elements on each row
-            for j in range(width):
-
-                # For storing the old matrix element values
-                row.insert(j, self.matrix[y-i][x+j])
-
-                # If there is padding, adding a grey frame with padding width above and below the obstacle
-                if i+1 <= padding or padding > (height-1 - i):
-                    self.matrix[y-i][x+j] = 2
-                # If there is padding, adding a grey frame with padding width to the left and right of the obstacle
-                elif j+1 <= padding or padding > (width-1 - j):
-                    self.matrix[y-i][x+j] = 2
-                # Adding non-padding area
-                else:
-                    self.matrix[y-i][x+j] = 0
-
-            # Storing the old matrix element values in 'matrix_backup' of given obstacle
-            obstacle.matrix_backup.insert(i, row)
-            
+        self.updateObstacle(obstacle, 1)
         obstacle.active = True
         return True
 
@@ -145,6 +146,7 @@ class Map:
     #     Returns True
     # If given index is out of bounds, or the corresponding Obstacle is already deactivated:
     #     Returns False
+    @timedCall('map.remove_obstacle')
     def removeObstacle(self, index):
         try:
             obstacle = self.obstacles[index]
@@ -155,26 +157,77 @@ class Map:
         if not obstacle.active:
             return False
 
+        self.updateObstacle(obstacle, -1)
+        obstacle.active = False
+        return True
+
+
+    # Takes an Obstacle, and 1 to add it resp. -1 to remove it
+    # Updates the counter layers for the area of the Obstacle, and the matrix elements in that area
+    def updateObstacle(self, obstacle, change):
+        (area, inner) = self.getObstacleArea(obstacle)
+
+        # The padding is the frame between the outer and the inner area
+        self.obstacle_count[inner] += change
+        self.padding_count[area] += change
+        self.padding_count[inner] -= change
+
+        # Recomputing the matrix elements in the area of the Obstacle from the layers
+        values = self.base[area].copy()
+        values[self.padding_count[area] > 0] = 2
+        values[self.obstacle_count[area] > 0] = 0
+        self.matrix[area] = values
+
+        self.updateClearance(area)
+
+
+    # Takes a tuple of (rows, columns)-slices of the matrix, for an area where elements have changed
+    #
+    # Recomputes the clearance (and inflated) layer for the elements within MAX_CLEARANCE of the area,
+    # from the black elements within 2*MAX_CLEARANCE of the area
+    # (elements farther away can Not be the closest black element of any recomputed element, within MAX_CLEARANCE)
+    def updateClearance(self, area):
+        (rows, cols) = self.matrix.shape
+        (top, bottom, left, right) = (area[0].start, area[0].stop, area[1].start, area[1].stop)
+
+        window = (clipSlice(top - 2*MAX_CLEARANCE, bottom + 2*MAX_CLEARANCE, rows),
+                  clipSlice(left - 2*MAX_CLEARANCE, right + 2*MAX_CLEARANCE, cols))
+        update = (clipSlice(top - MAX_CLEARANCE, bottom + MAX_CLEARANCE, rows),
+                  clipSlice(left - MAX_CLEARANCE, right + MAX_CLEARANCE, cols))
+
+        # The updated area, relative to the window
+        inner = (slice(update[0].start - window[0].start, update[0].stop - window[0].start),
+                 slice(update[1].start - window[1].start, update[1].stop - window[1].start))
+
+        self.clearance[update] = getClearance(self.matrix[window])[inner]
+        self.inflated[update] = self.clearance[update] < self.inflation
+
+
+    # Takes the radius (in cm) of a circle covering the cross-section of the truck (at most MAX_CLEARANCE)
+    # Recomputes the inflated layer, where the elements closer than the radius to a black element are True
+    def setInflation(self, radius):
+        self.inflation = min(radius, MAX_CLEARANCE)
+        self.inflated = self.clearance < self.inflation
+
+
+    # Takes an Obstacle
+    #
+    # Returns a tuple of (rows, columns)-slices of the matrix for the area covered by the Obstacle,
+    # and the same for the area inside its padding
+    # (both limited to the size of the matrix)
+    def getObstacleArea(self, obstacle):
         height = int(ceil(obstacle.height))
         width = int(ceil(obstacle.width))
         padding = int(ceil(obstacle.padding))
         (x, y) = (int(obstacle.x), int(obstacle.y))
 
+        # The Obstacle covers rows y-height+1 to y (it extends upwards from its lower left corner)
+        (top, bottom, left, right) = (y - height + 1, y + 1, x, x + width)
+        (rows, cols) = self.matrix.shape
 
-        # Using 'matrix_backup' of given obstacle to remove the obstacle
-        # and reset the affected section of the matrix:
-
-        # Going through all rows in the matrix
-        for i in range(height):
-
-            # Going through all elements on each row
-            for j in range(width):
-                self.matrix[y-i][x+j] = obstacle.matrix_backup[i][j]
-
-        # Clearing 'backup' of given obstacle
-        obstacle.matrix_backup = []
-        obstacle.active = False
-        return True
+        area = (clipSlice(top, bottom, rows), clipSlice(left, right, cols))
+        inner = (clipSlice(top + padding, bottom - padding, rows), clipSlice(left + padding, right - padding, cols))
+        return (area, inner)
 
 
     # Takes (x, y)-coordinates for an element
@@ -189,11 +242,41 @@ class Map:
     def getValue(self, x, y):
         (ix, iy) = (int(x), int(y))
         try:
-            return self.matrix[iy][ix]
+            return int(self.matrix[iy, ix])
         except IndexError:
             return None
 
 
+    # Takes (x, y)-coordinates for an element
+    #
+    # Coordinates are assumed to be in cm
+    #
+    # If given coordinates are valid for the matrix:
+    #     Returns the distance (in cm) from the element to the closest black element (at most MAX_CLEARANCE)
+    # If given coordinates are out of bounds:
+    #     Returns None
+    def getClearance(self, x, y):
+        (ix, iy) = (int(x), int(y))
+        if 0 <= ix < self.clearance.shape[1] and 0 <= iy < self.clearance.shape[0]:
+            return float(self.clearance[iy, ix])
+        return None
+
+
+    # Takes (x, y)-coordinates for the center of the truck
+    #
+    # Coordinates are assumed to be in cm
+    #
+    # If the truck fits at given position (No black element is closer than the inflation radius):
+    #     Returns True
+    # If it does not fit, or given coordinates are out of bounds:
+    #     Returns False
+    def isFree(self, x, y):
+        (ix, iy) = (int(x), int(y))
+        if 0 <= ix < self.inflated.shape[1] and 0 <= iy < self.inflated.shape[0]:
+            return not self.inflated[iy, ix]
+        return False
+
+
     # Takes (x, y)-coordinates
     #
     # Coordinates are assumed to be in cm
@@ -214,29 +297,40 @@ class Map:
         return None
 
 
+# Takes the start and stop index of a range, and the size of the dimension it indexes
+#
+# Returns a slice for the range, limited to [0, size]
+def clipSlice(start, stop, size):
+    return slice(min(max(start, 0), size), min(max(stop, 0), size))
+
+
+# Takes a 2-dimensional NumPy array (uint8) of Map values
+#
+# Returns a 2-dimensional NumPy array (float32) with the Euclidean distance from each element
+# to the closest black (0) element, limited to MAX_CLEARANCE
+# (elements outside the array are Not counted as black)
+def getClearance(matrix):
+    free = (matrix != 0).astype(np.uint8)
+    clearance = cv2.distanceTransform(free, cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+    return np.minimum(clearance, MAX_CLEARANCE, out=clearance)
+
+
 # Takes a path (relative to current directory) to a an image file containing a Map representation
 # (path='/map.png' for file 'map.png, located in current directory)
 # The file should be in '.png'-format
 #
-# Returns an array of rows, where each row is an array of elements
+# Returns a 2-dimensional NumPy array (uint8) of rows, where each row is an array of elements
 def readImgToMatrix(path):
     dirpath = dirname(abspath(__file__))
-    matrix = np.asarray(cv2.imread(dirpath + path, 0), dtype=np.uint8).tolist()
+    img = cv2.imread(dirpath + path, 0)
 
-    # Going through all elements, adjusting their value to match [0, 1, 2]
+    # Adjusting the value of all elements to match [0, 1, 2], in one pass through a lookup table
     # Where:
     #     0 = Black
     #     1 = White
     #     2 = Grey
-    for row in range(len(matrix)):
-        for elem in range(len(matrix[row])):
-            # Not black
-            if matrix[row][elem] != 0:
-                # White
-                if matrix[row][elem] == 255:
-                    matrix[row][elem] = 1
-                # Grey
-                else:
-                    matrix[row][elem] = 2
-
-    return matrix
+    table = np.full(256, 2, dtype=np.uint8)
+    table[0] = 0
+    table[255] = 1
+
+    return table[img]
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2017, Lars Niklasson
+Copyright (c) 2017, Filip Slottner Seholm
+Copyright (c) 2017, Fanny Sandblom
+Copyright (c) 2017, Kevin Hoogendijk
+Copyright (c) 2017, Nils Andren
+Copyright (c) 2017, Alicia Gil Martin
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the Chalmers University of Technology nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+import numpy as np
+from math import ceil, floor
+
+
+CELL_SIZE = 10  # Side of a grid cell, in cm (the Map is in cm, one element per cm)
+
+
+# For finding the edges of a CompactGraph that pass through a given area of the Map
+#
+# Each edge is rasterised once, into the grid cells it sweeps,
+# and the (cell, edge) pairs are stored sorted by cell:
+# the edges in cell c are 'edges[i]' for all i where 'cells[i] == c'
+class EdgeCellIndex:
+
+    # Takes a CompactGraph, and the side of a grid cell (optional)
+    def __init__(self, compact, cell_size=CELL_SIZE):
+        self.compact = compact
+        self.cell_size = float(cell_size)
+
+        sources = compact.getSources()
+        (x0s, y0s) = (compact.xs[sources], compact.ys[sources])
+        (x1s, y1s) = (compact.xs[compact.targets], compact.ys[compact.targets])
+
+        n = len(compact.xs)
+        self.x0 = float(compact.xs.min()) if n else 0.0
+        self.y0 = float(compact.ys.min()) if n else 0.0
+        self.cols = (int((float(compact.xs.max()) - self.x0) // self.cell_size) + 1) if n else 1
+
+        # Sampling each edge with at most half a cell between the samples,
+        # so every point on an edge is within a quarter of a cell from a sample
+        samples = np.ceil(compact.lengths / (self.cell_size / 2)).astype(np.int64) + 1
+        edge_ids = np.repeat(np.arange(len(samples)), samples)
+        steps = np.arange(len(edge_ids)) - np.repeat(np.cumsum(samples) - samples, samples)
+        t = steps / np.maximum(np.repeat(samples - 1, samples), 1).astype(np.float64)
+
+        xs = x0s[edge_ids] + t * (x1s - x0s)[edge_ids]
+        ys = y0s[edge_ids] + t * (y1s - y0s)[edge_ids]
+        cells = self.getCell(xs, ys)
+
+        # Unique (cell, edge) pairs, sorted by cell
+        pairs = np.unique(cells * max(len(samples), 1) + edge_ids)
+        self.cells = pairs // max(len(samples), 1)
+        self.edges = pairs % max(len(samples), 1)
+
+        self.segments = (x0s.tolist(), y0s.tolist(), x1s.tolist(), y1s.tolist())
+        (self.sources, self.targets) = (sources.tolist(), compact.targets.tolist())
+
+
+    # Takes arrays with (x, y)-coordinates
+    # Returns an array with the grid cell for each of the coordinates
+    def getCell(self, xs, ys):
+        cols = np.clip(np.floor((xs - self.x0) / self.cell_size), 0, self.cols-1).astype(np.int64)
+        rows = np.floor((ys - self.y0) / self.cell_size).astype(np.int64)
+        return rows * self.cols + cols
+
+
+    # Takes a rectangle (min x, min y, max x, max y)
+    #
+    # Returns a sorted array with the ids of all edges that pass through the rectangle
+    def getEdgesInRect(self, x_min, y_min, x_max, y_max):
+        # Every edge through the rectangle has a sample within a quarter of a cell from it
+        margin = self.cell_size / 4
+        col_min = max(int(floor((x_min - margin - self.x0) / self.cell_size)), 0)
+        col_max = min(int(floor((x_max + margin - self.x0) / self.cell_size)), self.cols-1)
+        row_min = int(floor((y_min - margin - self.y0) / self.cell_size))
+        row_max = int(floor((y_max + margin - self.y0) / self.cell_size))
+
+        candidates = set()
+        for row in range(row_min, row_max+1):
+            first = np.searchsorted(self.cells, row * self.cols + col_min, 'left')
+            last = np.searchsorted(self.cells, row * self.cols + col_max, 'right')
+            candidates.update(self.edges[first:last].tolist())
+
+        (x0s, y0s, x1s, y1s) = self.segments
+        return sorted(e for e in candidates
+                      if segmentIntersectsRect(x0s[e], y0s[e], x1s[e], y1s[e], x_min, y_min, x_max, y_max))
+
+
+    # Takes an iterable with edge ids
+    # Returns an array with the edges as tuples of (from Node id, to Node id)
+    def getEdgePairs(self, edges):
+        return [(self.sources[e], self.targets[e]) for e in edges]
+
+
+# Takes an Obstacle (see 'map_func'), and a margin (in cm) to add on each side (optional)
+#
+# Returns the rectangle (min x, min y, max x, max y) covered by the Obstacle, padding included,
+# as drawn in the Map matrix by Map.addObstacle()
+def getObstacleRect(obstacle, margin=0):
+    height = int(ceil(obstacle.height))
+    width = int(ceil(obstacle.width))
+    (x, y) = (int(obstacle.x), int(obstacle.y))
+    return (x - margin, y - height + 1 - margin, x + width + margin, y + 1 + margin)
+
+
+# Takes the (x, y)-coordinates for the end points of a line segment, and a rectangle (min x, min y, max x, max y)
+#
+# Liang-Barsky clipping of the segment against the rectangle
+#
+# If any part of the segment is inside the rectangle (borders included):
+#     Returns True
+# Otherwise:
+#     Returns False
+def segmentIntersectsRect(x0, y0, x1, y1, x_min, y_min, x_max, y_max):
+    (dx, dy) = (x1 - x0, y1 - y0)
+    (t0, t1) = (0.0, 1.0)
+
+    for (p, q) in ((-dx, x0 - x_min), (dx, x_max - x0), (-dy, y0 - y_min), (dy, y_max - y0)):
+        if p == 0:
+            # Parallel to this border, and outside of it
+            if q < 0:
+                return False
+        else:
+            t = float(q) / p
+            if p < 0:
+                t0 = max(t0, t)
+            else:
+                t1 = min(t1, t)
+            if t0 > t1:
+                return False
+
+    return True
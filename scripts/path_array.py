@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2017, Lars Niklasson
+Copyright (c) 2017, Filip Slottner Seholm
+Copyright (c) 2017, Fanny Sandblom
+Copyright (c) 2017, Kevin Hoogendijk
+Copyright (c) 2017, Nils Andren
+Copyright (c) 2017, Alicia Gil Martin
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the Chalmers University of Technology nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+from path_index import SegmentIndex, Projection
+from math import sin, cos
+import numpy as np
+
+
+COLLINEAR_TOLERANCE = 1e-6  # Largest distance (in cm) from a line at which a point is still on the line, for simplify()
+
+
+# For representing a path (e.g. a reference path from RefPath.getRefPath()) as NumPy arrays,
+# with the arc length, heading and curvature at each point computed once
+#
+# 'xs' and 'ys' hold the coordinates (in cm) of the points on the path
+# 'distances' holds the arc length from the start of the path to each point
+# 'headings' holds the direction (in radians) of the segment from each point to the next
+# (the last point has the direction of the last segment)
+# 'curvatures' holds the change of heading per cm at each point (positive for left turns, 0 at the end points)
+# 'indexes' holds the indexes of the waypoints on the path (as returned with the path by RefPath.getRefPath())
+class PathArray:
+
+    # Takes a path as an array of tuples of (x, y)-coordinates, or a NumPy array of shape (n, 2),
+    # and an array with indexes for the waypoints on the path (optional)
+    def __init__(self, path, indexes=None):
+        points = np.asarray(path, dtype=np.float64).reshape(-1, 2)
+        self.xs = np.ascontiguousarray(points[:, 0])
+        self.ys = np.ascontiguousarray(points[:, 1])
+        self.indexes = np.asarray(indexes if indexes is not None else [], dtype=np.int64)
+
+        (dx, dy) = (np.diff(self.xs), np.diff(self.ys))
+        segment_lengths = np.hypot(dx, dy)
+        self.distances = np.concatenate(([0.0], np.cumsum(segment_lengths)))[:len(self.xs)]
+
+        # Segments of length zero (repeated points) get the heading of the segment before them
+        # (or after them, at the start of the path)
+        segment_headings = np.arctan2(dy, dx)
+        valid = segment_lengths > 0
+        if valid.any():
+            previous = np.maximum.accumulate(np.where(valid, np.arange(len(valid)), -1))
+            previous[previous < 0] = np.argmax(valid)
+            segment_headings = segment_headings[previous]
+        self.headings = np.concatenate((segment_headings, segment_headings[-1:])) if len(dx) else np.zeros(len(self.xs))
+
+        # The turn at each inner point, divided by the mean length of the segments on both sides of it
+        self.curvatures = np.zeros(len(self.xs))
+        if len(dx) > 1:
+            turns = wrapAngles(np.diff(segment_headings))
+            spans = (segment_lengths[:-1] + segment_lengths[1:]) / 2
+            self.curvatures[1:-1] = np.where(spans > 0, turns / np.where(spans > 0, spans, 1), 0)
+
+        # Arc length to each waypoint, for finding the next waypoint in project()
+        self.waypoint_distances = self.distances[self.indexes]
+        self.segment_index = None
+
+
+    def __len__(self):
+        return len(self.xs)
+
+
+    # Returns the point at given index as a tuple of (x, y)-coordinates
+    def __getitem__(self, index):
+        return (float(self.xs[index]), float(self.ys[index]))
+
+
+    # Returns the length of the path (in cm)
+    def getLength(self):
+        return float(self.distances[-1]) if len(self.distances) else 0.0
+
+
+    # Returns a SegmentIndex over the segments of the path (built on first use)
+    def getSegmentIndex(self):
+        if self.segment_index is None:
+            self.segment_index = SegmentIndex(self.xs, self.ys)
+        return self.segment_index
+
+
+    # Takes a VehicleState object, and the segment of the previous Projection of the vehicle onto this path (optional)
+    #
+    # Finds the closest point on the path to the vehicle, searching the whole path in O(log n),
+    # or only around the previous segment if it is given (see SegmentIndex.nearestFrom())
+    #
+    # If the path has at least two points:
+    #     Returns a Projection
+    # Otherwise:
+    #     Returns None
+    def project(self, vehicle_state, segment=None):
+        if len(self.xs) < 2:
+            return None
+
+        index = self.getSegmentIndex()
+        if segment is None:
+            (segment, t, _) = index.nearest(vehicle_state.x, vehicle_state.y)
+        else:
+            (segment, t, _) = index.nearestFrom(vehicle_state.x, vehicle_state.y, segment)
+
+        (x1, y1) = (float(self.xs[segment]), float(self.ys[segment]))
+        (x, y) = (x1 + t * (float(self.xs[segment+1]) - x1), y1 + t * (float(self.ys[segment+1]) - y1))
+        progress = float(self.distances[segment]) + t * float(self.distances[segment+1] - self.distances[segment])
+        heading = float(self.headings[segment])
+
+        # The offset of the vehicle from the closest point, along the normal to the left of the path
+        lateral_error = cos(heading) * (vehicle_state.y - y) - sin(heading) * (vehicle_state.x - x)
+        heading_error = float(wrapAngles(vehicle_state.theta1 - heading))
+
+        i = int(np.searchsorted(self.waypoint_distances, progress, side='right'))
+        next_waypoint = int(self.indexes[i]) if i < len(self.indexes) else None
+
+        return Projection(segment, x, y, lateral_error, progress, heading_error, next_waypoint)
+
+
+    # Returns the path as an array of tuples of (x, y)-coordinates (as returned by RefPath.getRefPath())
+    def toList(self):
+        return list(zip(self.xs.tolist(), self.ys.tolist()))
+
+
+    # Takes an array of arc lengths (in cm) along the path
+    #
+    # Returns an array of shape (m, 2) with the (x, y)-coordinates at the given arc lengths,
+    # and an array with the heading of the path there
+    # (arc lengths outside the path are moved to its nearest end point)
+    def interpolate(self, distances):
+        distances = np.clip(np.asarray(distances, dtype=np.float64), 0, self.getLength())
+        points = np.column_stack((np.interp(distances, self.distances, self.xs),
+                                  np.interp(distances, self.distances, self.ys)))
+        segments = np.clip(np.searchsorted(self.distances, distances, side='right') - 1, 0, len(self.xs) - 1)
+        return (points, self.headings[segments])
+
+
+    # Takes the desired distance (in cm) between the points
+    #
+    # Returns a new PathArray with points at the given spacing along this path,
+    # where the waypoints are kept as points (so the spacing is shorter right before a waypoint, and at the end)
+    def resample(self, spacing):
+        if len(self.xs) < 2:
+            return PathArray(np.column_stack((self.xs, self.ys)), self.indexes)
+
+        waypoints = self.distances[self.indexes]
+        distances = np.unique(np.concatenate((np.arange(0, self.getLength(), spacing), waypoints,
+                                              [self.getLength()])))
+        (points, _) = self.interpolate(distances)
+        return PathArray(points, np.searchsorted(distances, waypoints))
+
+
+    # Takes the largest distance (in cm) that a removed point may have from the simplified path (optional)
+    #
+    # Douglas-Peucker simplification, which keeps the end points and the waypoints,
+    # and removes as many points in between as possible
+    # With the default tolerance, only points on a straight line between their neighbours are removed
+    #
+    # Returns a new PathArray with the remaining points, and the indexes of the waypoints among them
+    def simplify(self, tolerance=COLLINEAR_TOLERANCE):
+        count = len(self.xs)
+        keep = np.zeros(count, dtype=bool)
+        if count == 0:
+            return PathArray(np.zeros((0, 2)), self.indexes)
+
+        anchors = np.unique(np.concatenate(([0, count - 1], self.indexes)))
+        keep[anchors] = True
+
+        # Stack of (first, last) index pairs of parts that have to be simplified
+        stack = list(zip(anchors[:-1].tolist(), anchors[1:].tolist()))
+        while stack:
+            (first, last) = stack.pop()
+            if last - first < 2:
+                continue
+
+            distances = getSegmentDistances(self.xs[first+1:last], self.ys[first+1:last],
+                                            self.xs[first], self.ys[first], self.xs[last], self.ys[last])
+            farthest = int(np.argmax(distances))
+            if distances[farthest] > tolerance:
+                middle = first + 1 + farthest
+                keep[middle] = True
+                stack.append((first, middle))
+                stack.append((middle, last))
+
+        # The new index of each kept point is the number of kept points before it
+        new_indexes = np.cumsum(keep) - 1
+        return PathArray(np.column_stack((self.xs[keep], self.ys[keep])), new_indexes[self.indexes])
+
+
+# Takes an array of angles (in radians)
+# Returns the angles wrapped to [-pi, pi)
+def wrapAngles(angles):
+    return (angles + np.pi) % (2 * np.pi) - np.pi
+
+
+# Takes arrays of x- and y-coordinates of points, and the (x, y)-coordinates of the two end points of a line segment
+# Returns an array with the distance from each point to the closest point on the segment
+def getSegmentDistances(xs, ys, x1, y1, x2, y2):
+    (dx, dy) = (x2 - x1, y2 - y1)
+    squared_length = dx*dx + dy*dy
+    if squared_length == 0:
+        return np.hypot(xs - x1, ys - y1)
+
+    # Position of the closest point on the segment, as a share of the segment (0 at the first end point)
+    t = np.clip(((xs - x1) * dx + (ys - y1) * dy) / squared_length, 0, 1)
+    return np.hypot(xs - (x1 + t * dx), ys - (y1 + t * dy))
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2017, Lars Niklasson
+Copyright (c) 2017, Filip Slottner Seholm
+Copyright (c) 2017, Fanny Sandblom
+Copyright (c) 2017, Kevin Hoogendijk
+Copyright (c) 2017, Nils Andren
+Copyright (c) 2017, Alicia Gil Martin
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the Chalmers University of Technology nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+from heapq import heappush, heappop
+import numpy as np
+
+
+WINDOW = 8              # Number of segments on each side of the previous segment, searched by nearestFrom()
+MAX_SHIFTS = 4          # Maximum number of times nearestFrom() moves its window along the path
+MAX_WARM_DISTANCE = 50  # Largest distance (in cm) from the path at which the result of nearestFrom() is used
+
+
+# For finding the closest segment of a path (a polyline) to a point
+#
+# The segments are the leaves of a binary tree of bounding boxes, where each box covers two boxes of the level below
+# (consecutive segments of a path lie close together, so the boxes stay small)
+# Searching the tree nearest box first, and skipping boxes that are farther away than the closest segment found,
+# takes O(log n) box checks for a path of n segments
+class SegmentIndex:
+
+    # Takes arrays with the x- resp. y-coordinates of the points on the path (at least two points)
+    def __init__(self, xs, ys):
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        self.xs = xs.tolist()
+        self.ys = ys.tolist()
+        self.count = len(xs) - 1  # Number of segments
+
+        # Boxes as (min_x, min_y, max_x, max_y) arrays, for each level (level 0 holds a box for each segment)
+        boxes = (np.minimum(xs[:-1], xs[1:]), np.minimum(ys[:-1], ys[1:]),
+                 np.maximum(xs[:-1], xs[1:]), np.maximum(ys[:-1], ys[1:]))
+        self.levels = [[box.tolist() for box in boxes]]
+        while len(boxes[0]) > 1:
+            # An odd box is paired with itself
+            if len(boxes[0]) % 2:
+                boxes = [np.append(box, box[-1]) for box in boxes]
+            boxes = (np.minimum(boxes[0][0::2], boxes[0][1::2]), np.minimum(boxes[1][0::2], boxes[1][1::2]),
+                     np.maximum(boxes[2][0::2], boxes[2][1::2]), np.maximum(boxes[3][0::2], boxes[3][1::2]))
+            self.levels.append([box.tolist() for box in boxes])
+
+
+    # Takes (x, y)-coordinates of a point
+    #
+    # Returns a tuple of (index of the closest segment, position of the closest point on it as a share of the segment,
+    # squared distance to that point), where the lowest segment index wins a tie
+    def nearest(self, x, y):
+        best = (float('inf'), -1, 0.0)
+        top = len(self.levels) - 1
+        box_heap = [(0.0, top, 0)]
+
+        while box_heap:
+            (box_dist, level, i) = heappop(box_heap)
+            if box_dist > best[0]:
+                break
+
+            if level == 0:
+                (dist, t) = projectToSegment(x, y, self.xs[i], self.ys[i], self.xs[i+1], self.ys[i+1])
+                if (dist, i) < best[:2]:
+                    best = (dist, i, t)
+                continue
+
+            (min_x, min_y, max_x, max_y) = self.levels[level-1]
+            for child in (2*i, 2*i + 1):
+                if child < len(min_x):
+                    dx = max(min_x[child] - x, 0.0, x - max_x[child])
+                    dy = max(min_y[child] - y, 0.0, y - max_y[child])
+                    heappush(box_heap, (dx*dx + dy*dy, level - 1, child))
+
+        return (best[1], best[2], best[0])
+
+
+    # Takes (x, y)-coordinates of a point, and the index of a segment close to it (e.g. the previous result)
+    #
+    # Searches the WINDOW segments on each side of the given segment, and moves the window along the path
+    # as long as the closest segment is at its edge (at most MAX_SHIFTS times)
+    # This follows the path from where the point was before, so a path crossing or passing close to itself
+    # does not make the result jump to the other part of the path
+    #
+    # If the closest segment found is within MAX_WARM_DISTANCE:
+    #     Returns a tuple of (index of the segment, position on it, squared distance), see nearest()
+    # Otherwise:
+    #     Returns the result of nearest()
+    def nearestFrom(self, x, y, segment):
+        segment = min(max(segment, 0), self.count - 1)
+        best = None
+
+        for _ in range(MAX_SHIFTS + 1):
+            (first, last) = (max(segment - WINDOW, 0), min(segment + WINDOW, self.count - 1))
+            for i in range(first, last + 1):
+                (dist, t) = projectToSegment(x, y, self.xs[i], self.ys[i], self.xs[i+1], self.ys[i+1])
+                if best is None or dist < best[0]:
+                    best = (dist, i, t)
+
+            segment = best[1]
+            if not ((segment == first and first > 0) or (segment == last and last < self.count - 1)):
+                break
+
+        if best[0] > MAX_WARM_DISTANCE**2:
+            return self.nearest(x, y)
+        return (best[1], best[2], best[0])
+
+
+# For the result of projecting a vehicle onto a path (see PathArray.project())
+#
+# All measurements (including coordinates) are in cm
+class Projection:
+
+    def __init__(self, segment, x, y, lateral_error, progress, heading_error, next_waypoint):
+        self.segment = segment              # Index of the closest segment (from point 'segment' to point 'segment'+1)
+        self.x = x                          # Closest point on the path
+        self.y = y
+        self.lateral_error = lateral_error  # Distance to the path, positive if the vehicle is to the left of it
+        self.progress = progress            # Arc length from the start of the path to the closest point
+        self.heading_error = heading_error  # Vehicle heading minus path heading (in radians, in [-pi, pi))
+        self.next_waypoint = next_waypoint  # Path index of the next waypoint ahead (None if all have been passed)
+
+
+# Takes (x, y)-coordinates of a point, and (x, y)-coordinates of the two end points of a segment
+#
+# Returns a tuple of (squared distance from the point to the closest point on the segment,
+# position of that point as a share of the segment, 0 at the first end point)
+def projectToSegment(x, y, x1, y1, x2, y2):
+    (dx, dy) = (x2 - x1, y2 - y1)
+    squared_length = dx*dx + dy*dy
+    t = 0.0
+    if squared_length > 0:
+        t = min(max(((x - x1)*dx + (y - y1)*dy) / squared_length, 0.0), 1.0)
+    (ex, ey) = (x1 + t*dx - x, y1 + t*dy - y)
+    return (ex*ex + ey*ey, t)
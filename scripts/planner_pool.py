@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2017, Lars Niklasson
+Copyright (c) 2017, Filip Slottner Seholm
+Copyright (c) 2017, Fanny Sandblom
+Copyright (c) 2017, Kevin Hoogendijk
+Copyright (c) 2017, Nils Andren
+Copyright (c) 2017, Alicia Gil Martin
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the Chalmers University of Technology nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+from ref_path import *
+from map_func import Map
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+from tempfile import mkdtemp
+from shutil import rmtree
+from os.path import isdir, join
+from os import getpid
+import atexit
+import time
+
+
+WORKERS = 4             # Default number of planning processes
+SHARED_DIR = '/dev/shm' # Directory for the shared files (in memory on Linux), the default temp directory is used if missing
+
+# Names of the shared files
+GRAPH_FILE = 'graph.bin'    # The Graph, see 'graph_func.saveGraphToBinaryFile()'
+BLOCKED_FILE = 'blocked'    # One byte per edge, 1 if the edge is blocked
+MAP_FILE = 'map'            # The Map matrix (uint8)
+VERSION_FILE = 'version'    # Counter (int64) which is odd while the blocked edges are being written, see setObstacle()
+
+
+# For serving reference path requests from several processes (one core each), on one Graph
+#
+# The Graph, the blocked edges and the Map matrix are written once to files in shared memory,
+# which the worker processes memory-map, so they are neither copied nor re-parsed per process
+# Obstacles are handled by the pool process: it writes the blocked edges and the Map elements in place,
+# and the workers pick up the change (and drop their cached paths) on their next request
+#
+# Requests are returned as Futures, like for PlanningService
+class PlannerPool:
+
+    # Takes the number of planning processes (optional)
+    def __init__(self, workers=WORKERS):
+        self.ref_path = RefPath()
+        self.map = Map()
+        self.lock = Lock()
+        self.dir = mkdtemp(prefix='truck_map_', dir=SHARED_DIR if isdir(SHARED_DIR) else None)
+        # The shared files are held in memory, so they are removed when this process exits,
+        # also if the pool is never shut down (or this constructor fails)
+        self.pid = getpid()
+        atexit.register(removeSharedDir, self.dir, self.pid)
+
+        compact = self.ref_path.graph.getCompact()
+        saveGraphToBinaryFile(self.ref_path.graph, join(self.dir, GRAPH_FILE))
+        self.ref_path.getEdgeIndex()
+
+        self.blocked = np.memmap(join(self.dir, BLOCKED_FILE), dtype=np.uint8, mode='w+',
+                                 shape=(max(len(compact.targets), 1),))
+        self.version = np.memmap(join(self.dir, VERSION_FILE), dtype=np.int64, mode='w+', shape=(1,))
+
+        # The Map writes its matrix directly to the shared file from now on
+        matrix = np.memmap(join(self.dir, MAP_FILE), dtype=np.uint8, mode='w+', shape=self.map.matrix.shape)
+        matrix[:] = self.map.matrix
+        self.map.matrix = matrix
+
+        self.shared = (self.dir, self.map.matrix.shape)
+        self.executor = ProcessPoolExecutor(workers)
+
+
+    # Takes a VehicleState object, and an array of tuples of (x, y)-coordinates, assumed to be in cm
+    #
+    # Returns a Future for the result of RefPath.getRefPath() for the given parameters
+    def getRefPath(self, vehicle_state, pts):
+        return self.submit('getRefPath', (vehicle_state, list(pts)))
+
+
+    # Takes a path (as returned by getRefPath()),
+    # indexes for the start resp. end point, for the segment which should be replaced,
+    # and the largest allowed overlap between the alternative paths (optional, see RefPath.getAltPaths())
+    #
+    # Returns a Future for the result of RefPath.getAltPaths() for the given parameters
+    def getAltPaths(self, path, start_index, end_index, max_overlap=None):
+        return self.submit('getAltPaths', (path, start_index, end_index, max_overlap))
+
+
+    # Takes an array of tuples of (x, y)-coordinates, assumed to be in cm
+    #
+    # Returns a Future for an array with the Map values at the coordinates (see Map.getValue())
+    def getMapValues(self, pts):
+        return self.submit('getMapValues', (pts,))
+
+
+    # Takes an Index value for an Obstacle, and a Boolean (True to activate, False to deactivate)
+    #
+    # Blocks resp. unblocks the Graph edges through the Obstacle (see RefPath.setObstacle()),
+    # and adds resp. removes it from the Map, in the shared files
+    #
+    # If the Obstacle was activated resp. deactivated:
+    #     Returns True
+    # Otherwise:
+    #     Returns False
+    def setObstacle(self, index, active):
+        with self.lock:
+            if not self.ref_path.setObstacle(index, active):
+                return False
+
+            # The version is odd while the blocked edges are written, so the workers can tell a partial update
+            self.version[0] += 1
+            self.blocked[:] = 0
+            self.blocked[list(self.ref_path.graph.getCompact().blocked)] = 1
+            if active:
+                self.map.addObstacle(index)
+            else:
+                self.map.removeObstacle(index)
+            self.version[0] += 1
+            return True
+
+
+    # Takes an Index value for an Obstacle
+    # Activates the Obstacle if it is inactive, and deactivates it if it is active (see setObstacle())
+    def toggleObstacle(self, index):
+        index = index % max(len(self.ref_path.obstacles), 1)
+        return self.setObstacle(index, index not in self.ref_path.active_obstacles)
+
+
+    # Takes a Boolean, True to wait for all running requests to finish (optional)
+    # Stops the worker processes and removes the shared files, no more requests can be made afterwards
+    # (can be called more than once)
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait)
+        removeSharedDir(self.dir, self.pid)
+
+
+    # Takes the name of a PlannerWorker method, and a tuple with its arguments
+    # Returns a Future for the result of the method, run in one of the worker processes
+    def submit(self, name, args):
+        return self.executor.submit(runRequest, self.shared, name, args)
+
+
+# Takes the directory of the shared files of a PlannerPool, and the id of the process that created it
+# Removes the directory (if it still exists), unless called from another process, e.g. one forked from it
+def removeSharedDir(path, pid):
+    if getpid() == pid:
+        rmtree(path, ignore_errors=True)
+
+
+# The PlannerWorker of this process (if this process is a worker of a PlannerPool)
+worker = None
+
+
+# Takes a tuple of (directory of the shared files, shape of the Map matrix) from a PlannerPool,
+# the name of a PlannerWorker method, and a tuple with its arguments
+#
+# Runs in a worker process of the PlannerPool, attaching to the shared files on the first request
+#
+# Returns the result of the method
+def runRequest(shared, name, args):
+    global worker
+    if worker is None or worker.shared != shared:
+        worker = PlannerWorker(shared)
+    worker.update()
+    return getattr(worker, name)(*args)
+
+
+# For serving requests in a worker process of a PlannerPool, from the memory-mapped shared files
+class PlannerWorker:
+
+    # Takes a tuple of (directory of the shared files, shape of the Map matrix)
+    def __init__(self, shared):
+        self.shared = shared
+        (path, shape) = shared
+
+        data = np.memmap(join(path, GRAPH_FILE), dtype=np.uint8, mode='r')
+        self.graph = readBinaryDataToGraph(data, GRAPH_FILE, verify=False)
+        attachOracle(self.graph, readFileToOracle(getOraclePath(GRAPH_PATH)))
+        self.blocked = np.memmap(join(path, BLOCKED_FILE), dtype=np.uint8, mode='r')
+        self.version = np.memmap(join(path, VERSION_FILE), dtype=np.int64, mode='r')
+        self.matrix = np.memmap(join(path, MAP_FILE), dtype=np.uint8, mode='r', shape=shape)
+
+        self.cache = RouteCache(CACHE_SIZE)
+        self.current_version = 0
+
+
+    # Reads the blocked edges if they have been changed since the last request
+    # (a version which is odd, or changes while reading, means that the pool process is writing them)
+    def update(self):
+        compact = self.graph.getCompact()
+        while True:
+            version = int(self.version[0])
+            if version == self.current_version:
+                return
+            if version % 2 == 0:
+                blocked = frozenset(np.flatnonzero(self.blocked).tolist())
+                if int(self.version[0]) == version:
+                    break
+            time.sleep(0)
+
+        compact.blocked = blocked
+        self.cache.clear()
+        self.current_version = version
+
+
+    # Same as planRefPath()
+    def getRefPath(self, vehicle_state, pts):
+        result = planRefPath(self.graph, vehicle_state, pts, self.cache)
+        return result if result is not None else ([], [])
+
+
+    # Same as planAltPaths()
+    def getAltPaths(self, path, start_index, end_index, max_overlap=None):
+        return planAltPaths(self.graph, path, start_index, end_index, self.cache, max_overlap)
+
+
+    # Takes an array of tuples of (x, y)-coordinates, assumed to be in cm
+    # Returns an array with the Map values at the coordinates (None for coordinates out of bounds)
+    def getMapValues(self, pts):
+        (rows, cols) = self.matrix.shape
+        values = []
+        for (x, y) in pts:
+            (ix, iy) = (int(x), int(y))
+            values.append(int(self.matrix[iy, ix]) if 0 <= ix < cols and 0 <= iy < rows else None)
+        return values
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2017, Lars Niklasson
+Copyright (c) 2017, Filip Slottner Seholm
+Copyright (c) 2017, Fanny Sandblom
+Copyright (c) 2017, Kevin Hoogendijk
+Copyright (c) 2017, Nils Andren
+Copyright (c) 2017, Alicia Gil Martin
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the Chalmers University of Technology nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+from ref_path import *
+from planner_stats import STATS
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+
+WORKERS = 4  # Default number of planning threads
+
+
+# For serving reference path requests from several threads at once (e.g. one per truck), on one loaded Graph
+#
+# The Graph is loaded once and never changed afterwards: the searches keep their state in per-query scratch buffers,
+# and all results are returned instead of being stored in the service (unlike RefPath)
+# The requests are planned on a snapshot of the loaded Graph, which holds the CompactGraph built when the service
+# was created, so changes to the Graph loaded by the internal RefPath can Not change the Graph being planned on
+# Each request is run on a thread pool, and returned as a Future
+# (for planning in several processes, see 'planner_pool.PlannerPool')
+#
+# Obstacles are handled by an internal RefPath, whose changes are serialised by a lock
+# (requests already running finish on the edges that were blocked when they started)
+class PlanningService:
+
+    # Takes the number of planning threads (optional)
+    def __init__(self, workers=WORKERS):
+        self.ref_path = RefPath()
+        self.cache = self.ref_path.cache
+        self.lock = Lock()
+
+        # The snapshot, which the internal RefPath also blocks its Obstacles on
+        self.compact = self.ref_path.graph.getCompact()
+        self.graph = Graph(compact=self.compact)
+        self.graph.oracle = self.ref_path.graph.oracle
+        self.ref_path.graph = self.graph
+
+        # Building everything that is otherwise built on first use, before the Graph is shared between threads
+        self.graph.nodes
+        self.compact.getLists()
+        self.compact.getHeadingIndex()
+        self.compact.getIdAt(0, 0)
+        self.ref_path.getEdgeIndex()
+
+        self.executor = ThreadPoolExecutor(workers)
+
+
+    # Takes a VehicleState object, and an array of tuples of (x, y)-coordinates, assumed to be in cm
+    #
+    # Returns a Future for the result of RefPath.getRefPath() for the given parameters
+    def getRefPath(self, vehicle_state, pts):
+        return self.executor.submit(self.planRefPath, vehicle_state, list(pts))
+
+
+    # Takes a path (as returned by getRefPath()),
+    # indexes for the start resp. end point, for the segment which should be replaced,
+    # and the largest allowed overlap between the alternative paths (optional, see RefPath.getAltPaths())
+    #
+    # Returns a Future for the result of RefPath.getAltPaths() for the given parameters
+    def getAltPaths(self, path, start_index, end_index, max_overlap=None):
+        return self.executor.submit(planAltPaths, self.graph, path, start_index, end_index, self.cache, max_overlap)
+
+
+    # Takes a path (as returned by getRefPath()),
+    # indexes for the start resp. end point for the segment which should be replaced,
+    # and a number (>= 1) specifying which alternative path to use
+    #
+    # Returns a Future for the result of RefPath.getAltPath() for the given parameters
+    def getAltPath(self, path, start_index, end_index, nth):
+        return self.executor.submit(self.planAltPath, path, start_index, end_index, nth)
+
+
+    # Takes an Index value for an Obstacle, and a Boolean (True to activate, False to deactivate)
+    # Same as RefPath.setObstacle()
+    def setObstacle(self, index, active):
+        with self.lock:
+            return self.ref_path.setObstacle(index, active)
+
+
+    # Takes an Index value for an Obstacle
+    # Same as RefPath.toggleObstacle()
+    def toggleObstacle(self, index):
+        with self.lock:
+            return self.ref_path.toggleObstacle(index)
+
+
+    # Returns a Dictionary with statistics (hits, misses, etc) for the cache of computed paths
+    def getCacheStats(self):
+        return self.cache.getStats()
+
+
+    # Returns a Dictionary with timings and search counters for the queries answered so far (see PlannerStats.getStats())
+    # (the stats are shared by all planners in this process)
+    def getPlannerStats(self):
+        return STATS.getStats()
+
+
+    # Returns the planner stats as text, one metric per line (see PlannerStats.dumpMetrics())
+    def dumpMetrics(self):
+        return STATS.dumpMetrics()
+
+
+    # Takes a Boolean, True to wait for all running requests to finish (optional)
+    # Stops the executor, no more requests can be made afterwards
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait)
+
+
+    # Help function to 'getRefPath()', run by the executor
+    def planRefPath(self, vehicle_state, pts):
+        result = planRefPath(self.graph, vehicle_state, pts, self.cache)
+        return result if result is not None else ([], [])
+
+
+    # Help function to 'getAltPath()', run by the executor
+    def planAltPath(self, path, start_index, end_index, nth):
+        if nth < 1:
+            return None
+
+        alt_paths = planAltPaths(self.graph, path, start_index, end_index, self.cache)
+        if alt_paths is None:
+            return None
+
+        try:
+            return alt_paths[nth-1]
+        except IndexError:
+            return []
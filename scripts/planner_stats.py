@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2017, Lars Niklasson
+Copyright (c) 2017, Filip Slottner Seholm
+Copyright (c) 2017, Fanny Sandblom
+Copyright (c) 2017, Kevin Hoogendijk
+Copyright (c) 2017, Nils Andren
+Copyright (c) 2017, Alicia Gil Martin
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the Chalmers University of Technology nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from threading import local, Lock
+import sys
+import time
+
+
+RECENT_QUERIES = 1000   # Number of recent queries kept per query name, for the percentiles in getStats()
+PERCENTILES = [50, 90, 99]
+
+# Search counters, summed over all searches of a query (except 'peak_heap', which is the largest heap of any search)
+COUNTERS = ['searches', 'expanded', 'pushes', 'pops', 'peak_heap', 'path_bytes']
+
+
+# For the timings and counters of one query (e.g. one call to RefPath.getRefPath())
+class QueryStats:
+
+    # Takes the name of the query
+    def __init__(self, name):
+        self.name = name
+        self.start = time.time()
+        self.last = self.start  # End of the previous stage (see lap())
+        self.duration = None
+        # Seconds spent in each stage (e.g. 'snap', 'search', 'splice'), by stage name
+        self.stages = dict()
+        self.counters = dict((counter, 0) for counter in COUNTERS)
+
+
+    # Returns a Dictionary with the name, duration (in seconds), stage durations and counters of the query
+    def toDict(self):
+        return {'name': self.name, 'duration': self.duration, 'stages': dict(self.stages),
+                'counters': dict(self.counters)}
+
+
+# For collecting QueryStats and timed calls, and passing them on to callbacks
+#
+# The query that is running in a thread is kept per thread, so searches can report to it without being passed it
+class PlannerStats:
+
+    def __init__(self):
+        self.lock = Lock()
+        self.current = local()
+        self.callbacks = []
+
+        # Query name -> Dictionary with count, total duration, stage totals, counter totals and recent durations
+        self.queries = dict()
+        # Call name (e.g. 'map.add_obstacle') -> Dictionary with count, total duration and recent durations
+        self.calls = dict()
+
+
+    # Takes a function, which is called with the name and duration (in seconds) of each finished query and timed call,
+    # and the QueryStats of the query (None for a timed call)
+    def addCallback(self, callback):
+        self.callbacks.append(callback)
+
+
+    # Takes a function given to addCallback()
+    def removeCallback(self, callback):
+        self.callbacks.remove(callback)
+
+
+    # Returns the QueryStats of the query running in the current thread (None if No query is running)
+    def getCurrent(self):
+        return getattr(self.current, 'query', None)
+
+
+    # Takes a QueryStats object which is finished
+    # Adds it to the totals, and calls the callbacks with it
+    def addQuery(self, query):
+        with self.lock:
+            totals = self.queries.get(query.name)
+            if totals is None:
+                totals = {'count': 0, 'duration': 0.0, 'stages': dict(), 'counters': dict((c, 0) for c in COUNTERS),
+                          'recent': deque(maxlen=RECENT_QUERIES)}
+                self.queries[query.name] = totals
+
+            totals['count'] += 1
+            totals['duration'] += query.duration
+            totals['recent'].append(query.duration)
+            for (stage, duration) in query.stages.items():
+                totals['stages'][stage] = totals['stages'].get(stage, 0.0) + duration
+            for (counter, value) in query.counters.items():
+                if counter == 'peak_heap':
+                    totals['counters'][counter] = max(totals['counters'][counter], value)
+                else:
+                    totals['counters'][counter] += value
+
+        for callback in self.callbacks:
+            callback(query.name, query.duration, query)
+
+
+    # Takes the name and the duration (in seconds) of a timed call
+    # Adds it to the totals, and calls the callbacks with it
+    def addCall(self, name, duration):
+        with self.lock:
+            totals = self.calls.get(name)
+            if totals is None:
+                totals = {'count': 0, 'duration': 0.0, 'recent': deque(maxlen=RECENT_QUERIES)}
+                self.calls[name] = totals
+            totals['count'] += 1
+            totals['duration'] += duration
+            totals['recent'].append(duration)
+
+        for callback in self.callbacks:
+            callback(name, duration, None)
+
+
+    # Returns a Dictionary with the totals for each query and timed call,
+    # with percentiles of the recent durations (in seconds)
+    def getStats(self):
+        with self.lock:
+            stats = {'queries': dict(), 'calls': dict()}
+            for (kind, entries) in (('queries', self.queries), ('calls', self.calls)):
+                for (name, totals) in entries.items():
+                    entry = dict((key, value) for (key, value) in totals.items() if key != 'recent')
+                    for key in ('stages', 'counters'):
+                        if key in entry:
+                            entry[key] = dict(entry[key])
+                    entry['percentiles'] = getPercentiles(totals['recent'])
+                    stats[kind][name] = entry
+            return stats
+
+
+    # Returns the totals as text, one metric per line ("name{labels} value")
+    def dumpMetrics(self):
+        stats = self.getStats()
+        lines = []
+
+        for (name, entry) in sorted(stats['queries'].items()):
+            lines.append('planner_query_count{query="%s"} %d' % (name, entry['count']))
+            lines.append('planner_query_seconds_sum{query="%s"} %.6f' % (name, entry['duration']))
+            for (p, value) in sorted(entry['percentiles'].items()):
+                lines.append('planner_query_seconds{query="%s",quantile="0.%s"} %.6f' % (name, p, value))
+            for (stage, duration) in sorted(entry['stages'].items()):
+                lines.append('planner_stage_seconds_sum{query="%s",stage="%s"} %.6f' % (name, stage, duration))
+            for (counter, value) in sorted(entry['counters'].items()):
+                lines.append('planner_search_%s{query="%s"} %d' % (counter, name, value))
+
+        for (name, entry) in sorted(stats['calls'].items()):
+            lines.append('planner_call_count{call="%s"} %d' % (name, entry['count']))
+            lines.append('planner_call_seconds_sum{call="%s"} %.6f' % (name, entry['duration']))
+            for (p, value) in sorted(entry['percentiles'].items()):
+                lines.append('planner_call_seconds{call="%s",quantile="0.%s"} %.6f' % (name, p, value))
+
+        return '\n'.join(lines) + '\n'
+
+
+    # Removes all totals
+    def reset(self):
+        with self.lock:
+            self.queries.clear()
+            self.calls.clear()
+
+
+# The PlannerStats that the planner reports to
+STATS = PlannerStats()
+
+
+# Takes an array of durations
+# Returns a Dictionary with the PERCENTILES of the durations, by percentile (empty if there are No durations)
+def getPercentiles(durations):
+    durations = sorted(durations)
+    if not durations:
+        return {}
+    return dict((p, durations[min(len(durations) - 1, int(len(durations) * p / 100.0))]) for p in PERCENTILES)
+
+
+# Takes the name of a query
+#
+# Context manager for timing a query: the searches and stages inside it are added to its QueryStats,
+# which is passed to STATS when the query is finished
+# Inside another query, the outer query is used instead (so a query can call other queries)
+@contextmanager
+def query(name):
+    outer = STATS.getCurrent()
+    if outer is not None:
+        yield outer
+        return
+
+    stats = QueryStats(name)
+    STATS.current.query = stats
+    try:
+        yield stats
+    finally:
+        STATS.current.query = None
+        stats.duration = time.time() - stats.start
+        STATS.addQuery(stats)
+
+
+# Takes the name of a query
+# Returns a decorator which runs each call of the decorated function as a query with that name (see query())
+def timed(name):
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with query(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Takes the name of a stage
+# Adds the time since the previous call (or since the start of the query) to that stage of the running query
+# (does nothing if No query is running)
+#
+# Called at the end of each stage, so a stage is never counted twice, also across functions
+def lap(name):
+    stats = STATS.getCurrent()
+    if stats is not None:
+        now = time.time()
+        stats.stages[name] = stats.stages.get(name, 0.0) + now - stats.last
+        stats.last = now
+
+
+# Takes the number of expanded Nodes, heap pushes and pops, and the largest heap size of a search
+# Adds them to the counters of the running query (if any)
+def addSearch(expanded, pushes, pops, peak_heap):
+    stats = STATS.getCurrent()
+    if stats is not None:
+        counters = stats.counters
+        counters['searches'] += 1
+        counters['expanded'] += expanded
+        counters['pushes'] += pushes
+        counters['pops'] += pops
+        counters['peak_heap'] = max(counters['peak_heap'], peak_heap)
+
+
+# Takes an array of paths, where each path is an array of tuples of (x, y)-coordinates
+# Adds the number of bytes allocated for the paths (the arrays and their tuples) to the counters of the running query
+# (does nothing if No query is running)
+def addPaths(paths):
+    stats = STATS.getCurrent()
+    if stats is not None:
+        total = 0
+        for path in paths:
+            total += sys.getsizeof(path)
+            if path:
+                total += len(path) * sys.getsizeof(path[0])
+        stats.counters['path_bytes'] += total
+
+
+# Takes the name of a call
+# Returns a decorator which passes the duration of each call of the decorated function to STATS
+def timedCall(name):
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                STATS.addCall(name, time.time() - start)
+        return wrapper
+    return decorator
@@ -31,15 +31,26 @@ ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 from shortest_path import *
+from route_oracle import readFileToOracle, attachOracle, getOraclePath
+from obstacle_edges import EdgeCellIndex, getObstacleRect
+from incremental_path import IncrementalPlanner
+from map_func import OBSTACLES
+from planner_stats import timed, lap, addPaths
+from path_array import PathArray
 
 import warnings
 import _tkinter
+from collections import OrderedDict
+from itertools import chain, islice
 from math import sin, cos, radians
 import matplotlib.pyplot as plt
 
 
 GRAPH_PATH = '/graph.txt'
 ALT_PATHS = 50  # Maximum number of alternative paths to search for
+DIVERSE_PATHS = 5  # Maximum number of alternative paths to search for, when they should differ (see getAltPaths())
+CACHE_SIZE = 256  # Maximum number of paths and arrays of alternative paths to keep in the cache
+MAX_PLANNERS = 16  # Maximum number of goal Nodes to keep incremental search state for
 
 
 class VehicleState:
@@ -53,11 +64,106 @@ class VehicleState:
 
 class RefPath:
 
-    def __init__(self):
-        self.graph = readFileToGraph(GRAPH_PATH)
+    # If 'incremental' is True, the search state for each goal is kept and repaired
+    # when the vehicle moves or Obstacles change, instead of searching from scratch (see getIncrementalPath())
+    def __init__(self, incremental=False):
+        self.graph = loadGraph(GRAPH_PATH)
+        # Using the precomputed routes if they have been built for the current Graph file
+        attachOracle(self.graph, readFileToOracle(getOraclePath(GRAPH_PATH)))
         self.path = []
         self.alt_paths = ([], 0, 0)
         self.indexes = []
+        # Alternative paths generated so far by getAltPath(), see getLazyAltPaths()
+        self.lazy_alt_paths = None
+
+        # Computed paths and alternative paths, re-used for repeated requests
+        self.cache = RouteCache(CACHE_SIZE)
+
+        # Obstacles which can block the Graph (see setObstacle())
+        self.obstacles = OBSTACLES
+        # Active Obstacles by index, as tuples of (ids of the edges they block, cache tick when activated)
+        self.active_obstacles = dict()
+        self.edge_index = None
+
+        # IncrementalPlanner objects by goal Node id, least recently used first (None if Not incremental)
+        self.planners = OrderedDict() if incremental else None
+
+
+    # Returns a Dictionary with statistics (hits, misses, etc) for the cache of computed paths
+    def getCacheStats(self):
+        return self.cache.getStats()
+
+
+    # Takes an Index value for an Obstacle, as published on topic 'map_updated' by 'obstacle_node.py'
+    # Activates the Obstacle if it is inactive, and deactivates it if it is active (see setObstacle())
+    #
+    # If given index is out of bounds:
+    #     Returns False
+    # Otherwise:
+    #     Returns True
+    def toggleObstacle(self, index):
+        return self.setObstacle(index, (index % max(len(self.obstacles), 1)) not in self.active_obstacles)
+
+
+    # Takes an Index value for an Obstacle in 'map_func.OBSTACLES', and a Boolean (True to activate, False to deactivate)
+    #
+    # Blocks resp. unblocks the Graph edges that pass through the Obstacle,
+    # so that no path is created through an active Obstacle
+    # Only the cached paths which may have changed are dropped:
+    # when activating, the paths through the Obstacle,
+    # when deactivating, the paths computed while the Obstacle was active
+    #
+    # If the Obstacle was activated resp. deactivated:
+    #     Returns True
+    # If given index is out of bounds, or the Obstacle is already activated resp. deactivated:
+    #     Returns False
+    def setObstacle(self, index, active):
+        try:
+            obstacle = self.obstacles[index]
+        except IndexError:
+            return False
+
+        index = index % len(self.obstacles)
+        if active == (index in self.active_obstacles):
+            return False
+
+        compact = self.graph.getCompact()
+        edge_index = self.getEdgeIndex()
+
+        if active:
+            edges = edge_index.getEdgesInRect(*getObstacleRect(obstacle))
+            changed = compact.blockEdges(edges)
+            self.cache.invalidateEdges(edge_index.getEdgePairs(changed))
+            self.active_obstacles[index] = (edges, self.cache.tick)
+        else:
+            (edges, tick) = self.active_obstacles.pop(index)
+            changed = compact.unblockEdges(edges)
+            self.cache.invalidateSince(tick)
+
+        if self.planners:
+            for planner in self.planners.values():
+                planner.updateEdges(changed)
+
+        return True
+
+
+    # Returns the EdgeCellIndex for the current CompactGraph of the Graph
+    #
+    # If the Graph has been changed since the EdgeCellIndex was built,
+    # a new one is built, and the edges of all active Obstacles are blocked again
+    # (instead of the edges blocked in the old CompactGraph, which may Not cover new edges through an Obstacle)
+    def getEdgeIndex(self):
+        compact = self.graph.getCompact()
+
+        if self.edge_index is None or self.edge_index.compact is not compact:
+            self.edge_index = EdgeCellIndex(compact)
+            compact.clearBlocked()
+            for index, (_, tick) in self.active_obstacles.items():
+                edges = self.edge_index.getEdgesInRect(*getObstacleRect(self.obstacles[index]))
+                compact.blockEdges(edges)
+                self.active_obstacles[index] = (edges, tick)
+
+        return self.edge_index
 
 
     # Takes a VehicleState object, and an array of tuples of (x, y)-coordinates, assumed to be in cm
@@ -73,40 +179,17 @@ class RefPath:
     #     Returns [], []
     def getRefPath(self, vehicle_state, pts):
 
-        # Finding the Node (in valid direction) which is closest to the vehicle, to use as a start point
-        start_point = getClosestToVehicle(self.graph, vehicle_state)
-        # Returns [], [] if the vehicle is too far away from a valid start point
-        if not start_point:
-            print "== ERROR: The vehicle is too far away from a valid path"
+        # Making sure that the active Obstacles block the current Graph
+        if self.active_obstacles:
+            self.getEdgeIndex()
+
+        route = self.getIncrementalPath if self.planners is not None else None
+        result = planRefPath(self.graph, vehicle_state, pts, self.cache, route)
+        if result is None:
             return [], []
 
-        self.path = []
+        (self.path, self.indexes) = result
         self.alt_paths = ([], 0, 0)
-        self.indexes = []
-
-        # Adding start point to 'pts'
-        pts.insert(0, (start_point.x, start_point.y))
-
-        # If at least one coordinate point was given
-        if len(pts) > 1:
-            # Adding start point to path
-            self.path.append((start_point.x, start_point.y))
-            self.indexes.append(0)
-
-            # Calculating shortest path between the points
-            for point in pts[1:]:
-                path = shortestPath(self.graph, start_point, Point(point[0], point[1]))
-                if path != None:
-                    self.path += path[1:]
-                    self.indexes.append(len(self.path)-1)
-                    start_point = Point(self.path[-1][0], self.path[-1][1])
-
-                # If the given coordinate points were not in range of any Nodes
-                else:
-                    self.path = []
-                    self.indexes = []
-                    print "== ERROR: Reference path out of range for %s" % str(point)
-                    break
 
         # Printing status msg
         if self.path == []:
@@ -118,8 +201,65 @@ class RefPath:
         return self.path, self.indexes
 
 
+    # Takes a VehicleState object, and an array of tuples of (x, y)-coordinates
+    #
+    # Same as getRefPath(), but returns the reference path as a PathArray, with the indexes of the given points
+    #
+    # If a path could be created:
+    #     Returns a PathArray
+    # Otherwise:
+    #     Returns None
+    def getRefPathArray(self, vehicle_state, pts):
+        (path, indexes) = self.getRefPath(vehicle_state, pts)
+        if not path:
+            return None
+        return PathArray(path, indexes)
+
+
+    # Takes two Point objects with (x, y)-coordinates for start and end point
+    #
+    # Like 'shortestPath()', but re-uses the IncrementalPlanner for the end Node,
+    # which only repairs the parts of its search affected by Obstacle changes and the moved start Node
+    #
+    # If there is a path from the start Point to the end Point:
+    #     Returns the shortest path between them as an array of tuples of (x, y)-coordinates
+    # Otherwise:
+    #     Returns None
+    def getIncrementalPath(self, start, end):
+        compact = self.graph.getCompact()
+        start = getClosestId(compact, start, SNAP_RANGE)
+        end = getClosestId(compact, end, SNAP_RANGE)
+
+        if start is None or end is None:
+            return None
+
+        if start == end:
+            return []
+
+        planner = self.planners.pop(end, None)
+        # The search state is only valid for the CompactGraph it was built on
+        if planner is None or planner.compact is not compact:
+            planner = IncrementalPlanner(compact, end)
+        self.planners[end] = planner
+        while len(self.planners) > MAX_PLANNERS:
+            self.planners.popitem(last=False)
+
+        path = planner.getPath(start)
+        if not path:
+            return None
+
+        xs, ys = compact.getLists()[:2]
+        return [(xs[i], ys[i]) for i in path]
+
+
     # Takes a path (as returned by getRefPath()),
-    # and indexes for the start resp. end point, for the segment which should be replaced
+    # indexes for the start resp. end point, for the segment which should be replaced,
+    # and the largest share of their length that the alternative paths may have in common
+    # with each other and the current segment (optional, e.g. 0.5)
+    #
+    # Without 'max_overlap', the alternative paths are the (up to ALT_PATHS) shortest paths,
+    # which are often small variations of each other
+    # With 'max_overlap', only (up to DIVERSE_PATHS) paths that are clearly different are returned
     #
     # If the given parameters are invalid:
     #     Returns None
@@ -128,25 +268,19 @@ class RefPath:
     #     with the segement between given start and end points replaced with each of the alternative paths found
     # Otherwise:
     #     Returns []
-    def getAltPaths(self, path, start_index, end_index):
+    def getAltPaths(self, path, start_index, end_index, max_overlap=None):
 
-        # Checking validity of given indexes
-        try:
-            start_point = Point(*path[start_index])
-            end_point = Point(*path[end_index])
-        except IndexError:
-            return None
+        # Making sure that the active Obstacles block the current Graph
+        if self.active_obstacles:
+            self.getEdgeIndex()
 
-        alt_paths = altPaths(self.graph, start_point, end_point, ALT_PATHS)
+        alt_paths = planAltPaths(self.graph, path, start_index, end_index, self.cache, max_overlap)
+        if alt_paths is None:
+            return None
 
-        if alt_paths:
-            for i, alt in enumerate(alt_paths):
-                alt_paths[i] = path[:start_index] + alt + path[end_index+1:]
-        else:
-            alt_paths = []
-        
+        # getAltPath() re-uses the shortest alternative paths only
         self.path = path
-        self.alt_paths = (alt_paths, start_index, end_index)
+        self.alt_paths = (alt_paths, start_index, end_index) if max_overlap is None else ([], 0, 0)
         return alt_paths
 
 
@@ -162,6 +296,19 @@ class RefPath:
     # Otherwise:
     #     Returns []
     def getAltPath(self, path, start_index, end_index, nth):
+        alt_path = self.getSplicedAltPath(path, start_index, end_index, nth)
+        return list(alt_path) if alt_path is not None else None
+
+
+    # Takes a path (as returned by getRefPath()),
+    # indexes for the start resp. end point for the segment which should be replaced,
+    # and a number (>= 1) specifying which alternative path to use
+    #
+    # Same as getAltPath(), but the path is returned as a SplicedPath (a view of the given path and the alternative
+    # path, without copying them) if it had to be searched for
+    # Only as many alternative paths as needed are searched for (see getLazyAltPaths())
+    @timed('alt_path')
+    def getSplicedAltPath(self, path, start_index, end_index, nth):
 
         # Checking validity of given nth-value
         if nth < 1:
@@ -172,11 +319,274 @@ class RefPath:
         # If the complete set of alternative paths has already been computed for the given parameters,
         # no need to re-compute
         if path == self.path and alt[0] and start_index == alt[1] and end_index == alt[2]:
-            alt_paths = alt[0]
-        else:
-            alt_paths = self.getAltPaths(path, start_index, end_index)
+            try:
+                return alt[0][nth-1]
+            except IndexError:
+                return []
+
+        # Otherwise only searching for as many alternative paths as needed
+        lazy = self.getLazyAltPaths(path, start_index, end_index)
+        if lazy is None:
+            return None
+
+        alt_path = lazy.get(nth-1)
+        lap('search')
+        return alt_path if alt_path is not None else []
+
+
+    # Takes a path (as returned by getRefPath()),
+    # and indexes for the start resp. end point, for the segment which should be replaced
+    #
+    # If the given parameters are invalid:
+    #     Returns None
+    # Otherwise:
+    #     Returns a generator of SplicedPaths, the given path with the segment replaced with each alternative path,
+    #     in increasing order of length (each alternative path is only searched for when it is asked for)
+    def iterAltPaths(self, path, start_index, end_index):
+        lazy = self.getLazyAltPaths(path, start_index, end_index)
+        if lazy is None:
+            return None
+        return lazy.iterate()
+
+
+    # Takes a path (as returned by getRefPath()),
+    # and indexes for the start resp. end point, for the segment which should be replaced
+    #
+    # Re-uses the LazyAltPaths from the last call if it is for the same parameters, and still valid
+    #
+    # If the given parameters are invalid:
+    #     Returns None
+    # Otherwise:
+    #     Returns a LazyAltPaths object
+    def getLazyAltPaths(self, path, start_index, end_index):
 
+        # Making sure that the active Obstacles block the current Graph
+        if self.active_obstacles:
+            self.getEdgeIndex()
+
+        lazy = self.lazy_alt_paths
+        if lazy is None or not lazy.isValid(self.graph, path, start_index, end_index):
+            try:
+                lazy = LazyAltPaths(self.graph, path, start_index, end_index)
+            except IndexError:
+                return None
+            self.lazy_alt_paths = lazy
+        return lazy
+
+
+# For generating the alternative paths for a segment of a path one at a time (see RefPath.getAltPath()),
+# keeping the ones that have been generated
+class LazyAltPaths:
+
+    # Takes a Graph, a path (as returned by getRefPath()),
+    # and indexes for the start resp. end point, for the segment which should be replaced
+    # Raises IndexError if the indexes are out of bounds
+    def __init__(self, graph, path, start_index, end_index):
+        self.path = path
+        self.start_index = start_index
+        self.end_index = end_index
+
+        # The search is only valid for the edges which were blocked when it started
+        self.compact = graph.getCompact()
+        self.blocked = self.compact.blocked
+
+        self.segments = []
+        self.generator = iterAltPaths(graph, Point(*path[start_index]), Point(*path[end_index]))
+
+
+    # Takes a Graph, a path, and indexes for the start resp. end point of the segment
+    # Returns True if this object is for the same parameters, and No edges have been blocked or unblocked since
+    def isValid(self, graph, path, start_index, end_index):
+        return (graph.getCompact() is self.compact and self.compact.blocked is self.blocked and
+                start_index == self.start_index and end_index == self.end_index and path == self.path)
+
+
+    # Takes an index (0 for the first alternative path)
+    #
+    # If there is an alternative path with given index:
+    #     Returns a SplicedPath, the path with the segment replaced with that alternative path
+    # Otherwise:
+    #     Returns None
+    def get(self, index):
+        while len(self.segments) <= index and self.generator is not None:
+            segment = next(self.generator, None)
+            if segment is None:
+                self.generator = None
+            else:
+                self.segments.append(segment)
+
+        if index < len(self.segments):
+            return SplicedPath(self.path, self.start_index, self.end_index, self.segments[index])
+        return None
+
+
+    # Returns a generator of SplicedPaths for all alternative paths, starting with the ones already generated
+    def iterate(self):
+        index = 0
+        while True:
+            spliced = self.get(index)
+            if spliced is None:
+                return
+            yield spliced
+            index += 1
+
+
+# For representing a path with a segment replaced (path[:start_index] + segment + path[end_index+1:]),
+# without copying the path
+#
+# Can be used like a read-only array of tuples of (x, y)-coordinates (len(), indexing, slicing, iterating, comparing),
+# use list() to get an actual array
+class SplicedPath:
+
+    # Takes a path, indexes for the start resp. end point of the replaced segment, and the new segment
+    def __init__(self, path, start_index, end_index, segment):
+        self.path = path
+        self.start_index = start_index
+        self.end_index = end_index
+        self.segment = segment
+
+
+    def __len__(self):
+        return self.start_index + len(self.segment) + len(self.path) - self.end_index - 1
+
+
+    # Takes an index or a slice
+    # Returns the coordinates at given index, resp. an array with the coordinates in given slice
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("SplicedPath index out of range")
+
+        if index < self.start_index:
+            return self.path[index]
+        index -= self.start_index
+        if index < len(self.segment):
+            return self.segment[index]
+        return self.path[self.end_index + 1 + index - len(self.segment)]
+
+
+    def __iter__(self):
+        return chain(islice(self.path, self.start_index), self.segment, islice(self.path, self.end_index+1, None))
+
+
+    def __eq__(self, other):
         try:
-            return alt_paths[nth-1]
-        except IndexError:
-            return []
+            return len(self) == len(other) and all(a == b for (a, b) in zip(self, other))
+        except TypeError:
+            return False
+
+
+    def __ne__(self, other):
+        return not self == other
+
+
+    def __repr__(self):
+        return "SplicedPath(%s)" % list(self)
+
+
+# Takes a Graph, a VehicleState object, an array of tuples of (x, y)-coordinates (assumed to be in cm),
+# a RouteCache for storing and re-using computed paths (optional),
+# and a function for finding the path between two Points (optional, 'shortestPaths()' is used for all points at once if Not given)
+#
+# Same as RefPath.getRefPath(), but without storing anything in a RefPath object,
+# so it can be called for the same Graph from several threads at once (see 'planner_service.py')
+# The start point is inserted first in the given array of coordinates
+#
+# If the vehicle is too far away from a valid start point:
+#     Returns None
+# If a path could be created:
+#     Returns a reference path in the form of an array of tuples of (x, y)-coordinates (in cm),
+#     and an array with indexes for the points on the path which coincide
+#     with the start point, and the given coordinate points
+# Otherwise:
+#     Returns [], []
+@timed('ref_path')
+def planRefPath(graph, vehicle_state, pts, cache=None, route=None):
+
+    # Finding the Node (in valid direction) which is closest to the vehicle, to use as a start point
+    start_point = getClosestToVehicle(graph, vehicle_state)
+    lap('snap')
+    if not start_point:
+        print "== ERROR: The vehicle is too far away from a valid path"
+        return None
+
+    ref_path = []
+    indexes = []
+
+    # Adding start point to 'pts'
+    pts.insert(0, (start_point.x, start_point.y))
+
+    # If at least one coordinate point was given
+    if len(pts) > 1:
+        # Adding start point to path
+        ref_path.append((start_point.x, start_point.y))
+        indexes.append(0)
+
+        # Calculating shortest path between the points (all at once, unless a route function is given)
+        if route is None:
+            paths = shortestPaths(graph, [Point(point[0], point[1]) for point in pts], cache)
+
+        for i, point in enumerate(pts[1:]):
+            if route is None:
+                path = paths[i]
+            else:
+                path = route(start_point, Point(point[0], point[1]))
+                lap('search')
+            if path != None:
+                ref_path += path[1:]
+                indexes.append(len(ref_path)-1)
+                start_point = Point(ref_path[-1][0], ref_path[-1][1])
+
+            # If the given coordinate points were not in range of any Nodes
+            else:
+                ref_path = []
+                indexes = []
+                print "== ERROR: Reference path out of range for %s" % str(point)
+                break
+
+            lap('splice')
+
+    addPaths([ref_path])
+    return ref_path, indexes
+
+
+# Takes a Graph, a path (as returned by getRefPath()),
+# indexes for the start resp. end point, for the segment which should be replaced,
+# a RouteCache for storing and re-using computed paths (optional),
+# and the largest allowed overlap between the alternative paths (optional, see RefPath.getAltPaths())
+#
+# Same as RefPath.getAltPaths(), but without storing anything in a RefPath object
+#
+# If the given parameters are invalid:
+#     Returns None
+# If there is at least one alternative path between the given start and end points:
+#     Returns an array of paths, sorted in increasing order of length,
+#     with the segement between given start and end points replaced with each of the alternative paths found
+# Otherwise:
+#     Returns []
+@timed('alt_paths')
+def planAltPaths(graph, path, start_index, end_index, cache=None, max_overlap=None):
+
+    # Checking validity of given indexes
+    try:
+        start_point = Point(*path[start_index])
+        end_point = Point(*path[end_index])
+    except IndexError:
+        return None
+
+    k = ALT_PATHS if max_overlap is None else DIVERSE_PATHS
+    alt_paths = altPaths(graph, start_point, end_point, k, cache, max_overlap)
+
+    if alt_paths:
+        for i, alt in enumerate(alt_paths):
+            alt_paths[i] = path[:start_index] + alt + path[end_index+1:]
+    else:
+        alt_paths = []
+
+    lap('splice')
+    addPaths(alt_paths)
+    return alt_paths
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2017, Lars Niklasson
+Copyright (c) 2017, Filip Slottner Seholm
+Copyright (c) 2017, Fanny Sandblom
+Copyright (c) 2017, Kevin Hoogendijk
+Copyright (c) 2017, Nils Andren
+Copyright (c) 2017, Alicia Gil Martin
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the Chalmers University of Technology nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+from collections import OrderedDict
+from threading import RLock
+
+
+CACHE_SIZE = 256    # Default maximum number of cached results
+
+
+# For caching computed paths (or arrays of alternative paths), with least-recently-used eviction
+#
+# Each result is stored under a key (e.g. ('path', start Node id, end Node id)),
+# together with the version stamp of the Graph it was computed on,
+# the Set of edges (tuples of (from Node id, to Node id)) it uses, and the tick (counter of stored results) it was stored at
+#
+# A result is only returned for the same version stamp,
+# and can be invalidated by any of its edges through invalidateEdges(),
+# or by the time it was stored through invalidateSince()
+#
+# All methods lock the cache, so it can be shared by planning threads (see 'planner_service.py')
+class RouteCache:
+
+    # Takes the maximum number of cached results (optional)
+    def __init__(self, capacity=CACHE_SIZE):
+        self.capacity = capacity
+
+        # Key -> (value, Set of edges, tick), in order of use (least recently used first)
+        self.entries = OrderedDict()
+        # Edge -> Set of keys of the results using that edge
+        self.edge_keys = dict()
+        # Version stamp of the Graph the cached results were computed on
+        self.stamp = None
+        # Number of results stored so far
+        self.tick = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        self.lock = RLock()
+
+
+    # Takes a key, and the version stamp of the Graph
+    #
+    # If there is a result for given key, computed on the Graph with given version stamp:
+    #     Returns that result
+    # Otherwise:
+    #     Returns None
+    def get(self, key, stamp):
+        with self.lock:
+            if stamp != self.stamp:
+                self.clear()
+                self.stamp = stamp
+
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            # Re-inserting the result, marking it as the most recently used one
+            self.entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+
+    # Takes a key, a result, the version stamp of the Graph it was computed on,
+    # an iterable with the edges it uses, and a function which tells if the result is still valid (optional)
+    # Stores the result, evicting the least recently used result if the cache is full
+    #
+    # The function is called with the cache locked, and the result is only stored if it returns True
+    # (so that a result computed while edges were blocked or unblocked in another thread is Not stored
+    # after its invalidation, see 'shortest_path.getBlockedCheck()')
+    def put(self, key, value, stamp, edges, is_valid=None):
+        with self.lock:
+            if is_valid and not is_valid():
+                return
+
+            if stamp != self.stamp:
+                self.clear()
+                self.stamp = stamp
+
+            self.remove(key)
+            edges = frozenset(edges)
+            self.entries[key] = (value, edges, self.tick)
+            self.tick += 1
+            for edge in edges:
+                self.edge_keys.setdefault(edge, set()).add(key)
+
+            while len(self.entries) > self.capacity:
+                self.remove(next(iter(self.entries)))
+                self.evictions += 1
+
+
+    # Takes a key
+    # Removes the result for that key (if any)
+    def remove(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return
+
+            for edge in entry[1]:
+                keys = self.edge_keys.get(edge)
+                keys.discard(key)
+                if not keys:
+                    del self.edge_keys[edge]
+
+
+    # Takes an iterable with edges (tuples of (from Node id, to Node id))
+    # Removes all results that use any of the given edges
+    #
+    # Returns the number of removed results
+    def invalidateEdges(self, edges):
+        with self.lock:
+            keys = set()
+            for edge in edges:
+                keys.update(self.edge_keys.get(edge, ()))
+
+            for key in keys:
+                self.remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+
+    # Takes a tick (a value of 'tick')
+    # Removes all results that were stored at or after given tick
+    #
+    # Returns the number of removed results
+    def invalidateSince(self, tick):
+        with self.lock:
+            keys = [key for (key, entry) in self.entries.items() if entry[2] >= tick]
+
+            for key in keys:
+                self.remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+
+    # Removes all results
+    def clear(self):
+        with self.lock:
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+            self.edge_keys.clear()
+
+
+    # Returns a Dictionary with the number of cached results, hits, misses, evictions and invalidations
+    def getStats(self):
+        with self.lock:
+            return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'invalidations': self.invalidations}
+
+
+# Takes an array of Node ids for a path
+#
+# Returns an array with the edges of the path, as tuples of (from Node id, to Node id)
+def getPathEdges(path):
+    return zip(path[:-1], path[1:])
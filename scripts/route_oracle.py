@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+"""
+The Graph only changes when a new map is saved, so all shortest routes can be computed offline:
+
+    python route_oracle.py graph.txt
+
+stores a RouteOracle for 'graph.txt' in 'graph.oracle.npz', next to the Graph file.
+
+Copyright (c) 2017, Lars Niklasson
+Copyright (c) 2017, Filip Slottner Seholm
+Copyright (c) 2017, Fanny Sandblom
+Copyright (c) 2017, Kevin Hoogendijk
+Copyright (c) 2017, Nils Andren
+Copyright (c) 2017, Alicia Gil Martin
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the Chalmers University of Technology nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+from graph_func import *
+
+from heapq import heappush, heappop
+from os.path import dirname, abspath
+import numpy as np
+import sys
+
+
+MAX_NODES = 5000    # Largest Graph (in number of Nodes) to build a RouteOracle for
+
+
+# For answering shortest path queries on a static Graph without searching
+#
+# For each pair of Nodes (i, j), 'next_hop[i, j]' is the id of the Node after i on the shortest path from i to j,
+# and 'dist[i, j]' is the length of that path (next_hop is -1 and dist is inf if there is no path)
+#
+# 'fingerprint' is the fingerprint of the CompactGraph the RouteOracle was built for,
+# a RouteOracle is only used for a Graph with the same fingerprint
+class RouteOracle:
+
+    # Takes the next-hop and distance matrices, and the fingerprint of the CompactGraph
+    def __init__(self, next_hop, dist, fingerprint):
+        self.next_hop = next_hop
+        self.dist = dist
+        self.fingerprint = fingerprint
+
+        # The CompactGraph this RouteOracle has been attached to, see attachOracle()
+        self.compact = None
+
+
+    # Takes two Node ids for start and end point
+    #
+    # If there is a path from the start Node to the end Node:
+    #     Returns the shortest path as an array of Node ids, not including the start Node
+    # Otherwise:
+    #     Returns None
+    def getPath(self, start, end):
+        if self.next_hop.item(start, end) < 0:
+            return None
+
+        path = []
+        current = start
+        while current != end:
+            current = self.next_hop.item(current, end)
+            path.append(current)
+        return path
+
+
+    # Takes two Node ids for start and end point
+    #
+    # Returns the length of the shortest path from the start Node to the end Node (inf if there is no path)
+    def getDist(self, start, end):
+        return self.dist.item(start, end)
+
+
+# Takes a CompactGraph
+#
+# Runs Dijkstra's algorithm from every Node, keeping track of the first step on each shortest path
+#
+# If the CompactGraph has at most MAX_NODES Nodes:
+#     Returns a RouteOracle for it
+# Otherwise:
+#     Returns None
+def buildOracle(compact):
+    n = compact.size()
+    if n > MAX_NODES:
+        return None
+
+    offsets, targets, lengths = compact.getLists()[2:]
+    next_hop = np.full((n, n), -1, dtype=np.int32)
+    dist = np.full((n, n), np.inf, dtype=np.float32)
+
+    for source in range(n):
+        node_dist = {source: 0}
+        first_hop = {source: source}
+        done = set()
+        node_heap = [(0, source)]
+
+        while node_heap:
+            cost, current = heappop(node_heap)
+            if current in done:
+                continue
+            done.add(current)
+
+            for edge in range(offsets[current], offsets[current+1]):
+                out_edge = targets[edge]
+                new_cost = cost + lengths[edge]
+                if out_edge not in done and new_cost < node_dist.get(out_edge, float('inf')):
+                    node_dist[out_edge] = new_cost
+                    first_hop[out_edge] = out_edge if current == source else first_hop[current]
+                    heappush(node_heap, (new_cost, out_edge))
+
+        ids = list(first_hop.keys())
+        next_hop[source, ids] = [first_hop[i] for i in ids]
+        dist[source, ids] = [node_dist[i] for i in ids]
+        next_hop[source, source] = -1
+
+    return RouteOracle(next_hop, dist, compact.getFingerprint())
+
+
+# Takes a Graph and a RouteOracle
+#
+# If the RouteOracle was built for a Graph with the same Nodes and edges:
+#     Lets shortestPath() answer queries on given Graph from the RouteOracle, and returns True
+# Otherwise:
+#     Returns False
+def attachOracle(graph, oracle):
+    compact = graph.getCompact()
+    if oracle is None or oracle.fingerprint != compact.getFingerprint():
+        return False
+
+    oracle.compact = compact
+    graph.oracle = oracle
+    return True
+
+
+# Takes a RouteOracle and a filename
+# Stores the RouteOracle in a file with given filename ('.npz'-format),
+# which can be re-read by calling 'readFileToOracle(path_to_savefile)'
+def saveOracleToFile(oracle, filename):
+    with open(filename, 'wb') as file:
+        np.savez(file, next_hop=oracle.next_hop, dist=oracle.dist, fingerprint=np.array(oracle.fingerprint))
+
+
+# Takes a path (relative to current directory), to a file created by saveOracleToFile()
+# (path='/graph.oracle.npz' for file 'graph.oracle.npz', located in current directory)
+#
+# If the file exists and could be read:
+#     Returns a RouteOracle
+# Otherwise:
+#     Returns None
+def readFileToOracle(path):
+    dirpath = dirname(abspath(__file__))
+    try:
+        data = np.load(dirpath + path)
+        return RouteOracle(data['next_hop'], data['dist'], str(data['fingerprint']))
+    except (IOError, KeyError, ValueError):
+        return None
+
+
+# Takes a path to a Graph file (as given to readFileToGraph())
+#
+# Returns the path of the RouteOracle file for that Graph
+def getOraclePath(graph_path):
+    return graph_path.rsplit('.', 1)[0] + '.oracle.npz'
+
+
+# Building and storing a RouteOracle for a Graph file
+if __name__ == '__main__':
+    graph_path = '/' + (sys.argv[1] if len(sys.argv) > 1 else 'graph.txt')
+    try:
+        graph = readFileToGraph(graph_path)
+    except IOError:
+        graph = None
+
+    # The file is missing, or has syntax errors
+    if graph is None:
+        print "Could not read a Graph from '%s'" % graph_path[1:]
+        sys.exit(1)
+
+    oracle = buildOracle(graph.getCompact())
+    if oracle:
+        saveOracleToFile(oracle, dirname(abspath(__file__)) + getOraclePath(graph_path))
+        print "RouteOracle stored in '%s'" % getOraclePath(graph_path)[1:]
+    else:
+        print "The Graph is too large for a RouteOracle (more than %s Nodes)" % MAX_NODES
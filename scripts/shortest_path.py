@@ -31,71 +31,161 @@ ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 from graph_func import *
+from route_cache import RouteCache, getPathEdges
+from planner_stats import addSearch, lap
 from heapq import heappush, heappop
+from itertools import islice
+from math import sqrt
 
 
-# Takes a Graph and two Point objects with (x, y)-coordinates for start and end point
+SNAP_RANGE = 20     # Maximum distance (in cm) in x and y from a given start or end point to its Node
+
+# Used by diversePaths()
+MAX_OVERLAP = 0.5           # Largest share of a path's length which may overlap an already accepted path
+MAX_STRETCH = 2.0           # Largest length of a path, relative to the shortest path
+PENALTY = 1.0               # Relative increase of the cost of an edge, each time it is part of a path found
+PENALTY_ITERATIONS = 4      # Maximum number of searches per path asked for
+
+# Takes a Graph, two Point objects with (x, y)-coordinates for start and end point,
+# and a RouteCache for storing and re-using computed paths (optional)
 #
 # If there is a path from the start Point to the end Point:
 #     Returns the shortest path between them as an array of tuples of (x, y)-coordinates
 # Otherwise:
 #     Returns None
-def shortestPath(graph, start, end):
-
-    # Used to specify search range for finding closest point
-    search_range = 20
-    nodes = graph.nodes.values()
-
-    # Finding start resp. end Node:
-
-    start_node = graph.getNode(start.x, start.y)
-
-    # If the coordinates for the start point does Not exactly match a Node in the graph
-    if not start_node:
-
-        # Selecting all Nodes which are in range from the start point
-        nodes = getAllInRangeX(getAllInRangeY(nodes, start, search_range), start, search_range)
-        # Returning None if No Node is in range
-        if not nodes:
-            return None
-        # Finding the two Nodes which are closest to the start point, x-wise resp. y-wise
-        closest_x = getClosestX(nodes, start)
-        closest_y = getClosestY(nodes, start)
-        # Selecting the Node which is closest to the start point
-        dx = Node(start.x, start.y).getEdgeLength(closest_x)
-        dy = Node(start.x, start.y).getEdgeLength(closest_y)
-        start_node = closest_x if dx <= dy else closest_y
-
-    end_node = graph.getNode(end.x, end.y)
-
-    # If the coordinates for the end point does Not exactly match a Node in the graph
-    if not end_node:
-
-        # Selecting all Nodes which are in range from the end point
-        nodes = getAllInRangeX(getAllInRangeY(nodes, end, search_range), end, search_range)
-        # Returning None if No Node is in range
-        if not nodes:
-            return None
-        # Finding the two Nodes which are closest to the end point, x-wise resp. y-wise
-        closest_x = getClosestX(nodes, end)
-        closest_y = getClosestY(nodes, end)
-        # Selecting the Node which is closest to the end point
-        dx = Node(end.x, end.y).getEdgeLength(closest_x)
-        dy = Node(end.x, end.y).getEdgeLength(closest_y)
-        end_node = closest_x if dx <= dy else closest_y
-
-    path_list = kShortestPaths(graph, start_node, end_node, 1)
-
-    if path_list:
-        return path_list[0]
+def shortestPath(graph, start, end, cache=None):
+
+    # Finding start resp. end Node
+    # (the ids of the Nodes closest to the given start and end points)
+    compact = graph.getCompact()
+    start = getClosestId(compact, start, SNAP_RANGE)
+    end = getClosestId(compact, end, SNAP_RANGE)
+
+    # Returning None if No Node is in range
+    if start is None or end is None:
+        return None
+
+    if start == end:
+        return []
+
+    key = ('path', start, end)
+    is_valid = getBlockedCheck(compact)
+    if cache:
+        path = cache.get(key, graph.compact_edits)
+        if path is not None:
+            return list(path)
+
+    # Answering from the precomputed RouteOracle if there is one for this Graph (and No edges are blocked),
+    # otherwise searching
+    if graph.oracle and graph.oracle.compact is compact and not compact.blocked:
+        path = graph.oracle.getPath(start, end)
     else:
-        return path_list
+        path = aStar(compact, start, end)
+        path = [i for (i, _) in path] if path else None
+
+    if not path:
+        return None
+
+    path.insert(0, start)
+    xs, ys = compact.getLists()[:2]
+    coords = [(xs[i], ys[i]) for i in path]
+
+    if cache:
+        cache.put(key, coords, graph.compact_edits, getPathEdges(path), is_valid)
+    return list(coords)
+
+
+# Takes a Graph, an array of Point objects with (x, y)-coordinates (the start point followed by the points to visit),
+# and a RouteCache for storing and re-using computed paths (optional)
+#
+# Same as calling shortestPath() from each point to the next, but all points are snapped to Nodes at once,
+# and the paths which start at the same Node are found by a single search
+#
+# Returns an array with the shortest path from each point to the next (see shortestPath()),
+# where the paths from the first point that is Not in range of any Node, and after it, are None
+def shortestPaths(graph, points, cache=None):
+    compact = graph.getCompact()
+    ids = getClosestIds(compact, [p.x for p in points], [p.y for p in points], SNAP_RANGE).tolist()
+    lap('snap')
+    xs, ys = compact.getLists()[:2]
+    is_valid = getBlockedCheck(compact)
+    use_oracle = graph.oracle and graph.oracle.compact is compact and not compact.blocked
+
+    paths = [None] * (len(points) - 1)
+    # Indexes of the paths which have to be searched for, by start Node
+    pending = {}
+
+    for i in range(len(paths)):
+        (start, end) = (ids[i], ids[i+1])
+        if start < 0 or end < 0:
+            break
+
+        if start == end:
+            paths[i] = []
+            continue
+
+        if cache:
+            path = cache.get(('path', start, end), graph.compact_edits)
+            if path is not None:
+                paths[i] = list(path)
+                continue
+
+        if use_oracle:
+            path = graph.oracle.getPath(start, end)
+            if path:
+                paths[i] = getLegCoords(graph, cache, is_valid, xs, ys, [start] + path)
+        else:
+            pending.setdefault(start, []).append(i)
+
+    for start, legs in pending.items():
+        ends = set(ids[i+1] for i in legs)
+        # A single end Node is searched for with A*, which gives the same path as shortestPath()
+        if len(ends) == 1:
+            end = ids[legs[0]+1]
+            path = aStar(compact, start, end)
+            found = {end: path} if path else {}
+        else:
+            found = dijkstraToTargets(compact, start, ends)
+
+        for i in legs:
+            path = found.get(ids[i+1])
+            if path:
+                paths[i] = getLegCoords(graph, cache, is_valid, xs, ys, [start] + [j for (j, _) in path])
+
+    lap('search')
+    return paths
+
+
+# Takes a Graph, a RouteCache (or None) and its validity check (see getBlockedCheck()),
+# the coordinate arrays of the CompactGraph, and a path as an array of Node ids
+#
+# Stores the path in the cache (if given)
+#
+# Returns the path as an array of tuples of (x, y)-coordinates
+def getLegCoords(graph, cache, is_valid, xs, ys, path):
+    coords = [(xs[i], ys[i]) for i in path]
+    if cache:
+        cache.put(('path', path[0], path[-1]), coords, graph.compact_edits, getPathEdges(path), is_valid)
+    return list(coords)
+
+
+# Takes a CompactGraph
+#
+# Returns a function which returns True as long as No edges of the CompactGraph have been blocked or unblocked since
+# (for RouteCache.put(), since a result computed before a change may be stored after the change was handled)
+def getBlockedCheck(compact):
+    blocked = compact.blocked
+    return lambda: compact.blocked is blocked
 
 
 # Takes a Graph, two Point objects with (x, y)-coordinates for start and end point,
-# and the desired number of alternative paths
+# the desired number of alternative paths, a RouteCache for storing and re-using computed paths (optional),
+# and the largest allowed overlap between the paths (optional)
 #
 # The given start and end Points have to exactly match Nodes in the given Graph
+# By default the alternative paths are the k shortest loopless paths (see yenShortestPaths()),
+# if 'max_overlap' is given, they are paths which overlap each other and the shortest path
+# by at most that share of their length (see diversePaths())
 #
 # If given paramaters are invalid:
 #     Returns None
@@ -104,27 +194,147 @@ def shortestPath(graph, start, end):
 #     where each path is an array of tuples of (x, y)-coordinates
 # Otherwise:
 #     Returns []
-def altPaths(graph, start, end, k):
-    start_node = graph.getNode(start.x, start.y)
-    end_node = graph.getNode(end.x, end.y)
+def altPaths(graph, start, end, k, cache=None, max_overlap=None):
+    compact = graph.getCompact()
+    start = compact.getIdAt(start.x, start.y)
+    end = compact.getIdAt(end.x, end.y)
+    lap('snap')
 
     # Returning None if the given start and end Points do Not exactly match Nodes in the given Graph
-    if not start_node or not end_node:
+    if start is None or end is None:
         return None
 
-    paths = kShortestPaths(graph, start_node, end_node, k+1)
+    if start == end:
+        return []
 
-    # If there are any alternative paths, returns all (at most k) alternative paths found
-    if paths:
-        return paths[1:]
+    key = ('alt', start, end, k, max_overlap)
+    is_valid = getBlockedCheck(compact)
+    if cache:
+        paths = cache.get(key, graph.compact_edits)
+        if paths is not None:
+            lap('search')
+            return [list(path) for path in paths]
+
+    # The first path found is the shortest path, the rest are the alternative paths
+    if max_overlap is None:
+        found = [[l.node for l in link.getLinks()] for link in yenShortestPaths(compact, start, end, k+1)]
     else:
+        found = diversePaths(compact, start, end, k+1, max_overlap)
+    xs, ys = compact.getLists()[:2]
+    paths = [[(xs[i], ys[i]) for i in path] for path in found[1:]]
+
+    # The alternative paths also depend on the edges of the shortest path
+    if cache:
+        edges = set()
+        for path in found:
+            edges.update(getPathEdges(path))
+        cache.put(key, paths, graph.compact_edits, edges, is_valid)
+    lap('search')
+    return [list(path) for path in paths]
+
+
+# Takes a CompactGraph, two Node ids for start and end point, the desired number of paths,
+# the largest allowed share of a path's length that may overlap an already accepted path (optional),
+# and the largest allowed length of a path relative to the shortest path (optional)
+#
+# Penalty method: after each search, the costs of the edges of the path found are increased,
+# which pushes the next search away from the paths found so far
+# A path is accepted if it is Not too long, and does Not overlap any accepted path by more than 'max_overlap'
+# The first path is the shortest path, the search stops after k paths, or after 'PENALTY_ITERATIONS' searches per path
+#
+# Returns an array of (at most k) paths as arrays of Node ids (including the start Node),
+# the shortest path first, and the rest in order of length (increasing)
+def diversePaths(compact, start, end, k, max_overlap=MAX_OVERLAP, max_stretch=MAX_STRETCH):
+    lengths = compact.getLists()[4]
+    costs = list(lengths)
+
+    spur = aStar(compact, start, end)
+    if not spur:
         return []
+    shortest = [start] + [i for (i, _) in spur]
+    shortest_length = sum(length for (_, length) in spur)
+
+    # Accepted paths, as tuples of (length, path, Dictionary of edge id -> length)
+    accepted = [(shortest_length, shortest, getEdgeLengths(compact, shortest, costs))]
+    found = set([tuple(shortest)])
+    edges = accepted[0][2]
+
+    for _ in range(PENALTY_ITERATIONS * k):
+        if len(accepted) >= k:
+            break
+
+        # Penalising the edges of the last path found
+        for edge in edges:
+            costs[edge] *= 1 + PENALTY
+
+        spur = aStar(compact, start, end, costs=costs)
+        if not spur:
+            break
+        path = [start] + [i for (i, _) in spur]
+        edges = getEdgeLengths(compact, path, costs)
+        if tuple(path) in found:
+            continue
+        found.add(tuple(path))
+
+        length = sum(l for (_, l) in spur)
+        if length > max_stretch * shortest_length:
+            continue
+
+        # Share of the path's length that is also part of an accepted path
+        overlap = max(sum(l for (e, l) in edges.items() if e in other) for (_, _, other) in accepted)
+        if overlap <= max_overlap * length:
+            accepted.append((length, path, edges))
+
+    return [accepted[0][1]] + [path for (_, path, _) in sorted(accepted[1:], key=lambda a: a[0])]
+
+
+# Takes a CompactGraph, a path as an array of Node ids, and the cost of each edge
+#
+# Returns a Dictionary with the length of each edge of the path, by edge id
+# (where there are several edges between two Nodes, the one with the lowest cost is the one a search would use)
+def getEdgeLengths(compact, path, costs):
+    offsets, targets, lengths = compact.getLists()[2:]
+    edges = {}
+    for (a, b) in getPathEdges(path):
+        edge = min((e for e in range(offsets[a], offsets[a+1]) if targets[e] == b and e not in compact.blocked),
+                   key=lambda e: costs[e])
+        edges[edge] = lengths[edge]
+    return edges
+
+
+# Takes a Graph, and two Point objects with (x, y)-coordinates for start and end point
+#
+# The given start and end Points have to exactly match Nodes in the given Graph
+# Like altPaths(), but the alternative paths are searched for one at a time, as they are asked for
+# (the cache is not used, since the search continues from where it left off)
+#
+# If given paramaters are invalid:
+#     Returns None
+# Otherwise:
+#     Returns a generator of the alternative paths between them, in order of length (increasing),
+#     where each path is an array of tuples of (x, y)-coordinates
+def iterAltPaths(graph, start, end):
+    compact = graph.getCompact()
+    start = compact.getIdAt(start.x, start.y)
+    end = compact.getIdAt(end.x, end.y)
+
+    if start is None or end is None:
+        return None
+
+    if start == end:
+        return iter([])
+
+    # The first path found is the shortest path, the rest are the alternative paths
+    paths = iterShortestPaths(compact, start, end)
+    next(paths, None)
+    return (link.getCoords(compact) for link in paths)
 
 
 # Takes a Graph, two Nodes for start and end point, the desired number of shortest paths,
 # and a Boolean that decides if loops should be allowed or not (optional)
 #
-# By default, loops (i.e. the same Node being visited more than once) are Not allowed
+# By default, loops (i.e. the same Node being visited more than once) are Not allowed,
+# and the paths are found with Yen's k-shortest-loopless-paths algorithm
 #
 # If the start Node is the same as the end Node:
 #     Returns []
@@ -137,99 +347,385 @@ def kShortestPaths(graph, start_node, end_node, k, allow_loops=False):
     if start_node == end_node:
         return []
 
-    path_heap = []
-    paths = []
+    compact = graph.getCompact()
+    start = compact.getId(start_node)
+    end = compact.getId(end_node)
 
-    graph.resetGraph()
-    heappush(path_heap, (0, [(start_node.x, start_node.y)]))
-
-    # Repeating until the end Node has been visited k times
-    # (or until we know that there is no more paths from the start Node to the end Node)
-    while end_node.count < k and path_heap:
-        cost, path = heappop(path_heap)
-        current_node = graph.getNode(path[-1][0], path[-1][1])
-        current_node.count += 1
+    if allow_loops:
+        links = kShortestWalks(compact, start, end, k)
+    else:
+        links = yenShortestPaths(compact, start, end, k)
 
-        # If the end Node has been reached, adding this path to the array of shortest paths
-        if current_node == end_node:
-            paths.append(path)
-
-        # Otherwise if the current Node is not already in all k shortest paths,
-        # adding all possible paths forward from this Node to the path heap
-        elif current_node.count <= k or allow_loops:
-            for out_edge in current_node.out_edges:
-                if (out_edge.x, out_edge.y) not in path or allow_loops:
-                    new_path = []
-                    for coord in path:
-                        new_path.append(coord)
-                    new_path.append((out_edge.x, out_edge.y))
-                    new_cost = cost + current_node.getEdgeLength(out_edge)
-                    heappush(path_heap, (new_cost, new_path))
-
-    if paths:
-        return paths
+    if links:
+        return [link.getCoords(compact) for link in links]
     # Returns None if No paths were found
     else:
         return None
 
 
-# Takes a Graph and a VehicleState object
+# For representing a path as a link in a prefix tree of paths
+#
+# Each link only stores its last Node id, so paths that share a prefix
+# (which all alternative paths found by kShortestPaths() do) store that prefix only once
+class PathLink:
+
+    # Takes a Node id, the PathLink of the path up to the previous Node (None for a start Node),
+    # and the total length of the path up to this Node
+    def __init__(self, node, parent, cost):
+        self.node = node
+        self.parent = parent
+        self.cost = cost
+        self.depth = parent.depth + 1 if parent else 0
+
+        # Links for paths continuing from this link, by their next Node id (the prefix tree)
+        self.children = {}
+        # Next Node ids of the accepted shortest paths that go through this link
+        self.accepted_next = set()
+
+
+    # Takes a Node id and the length of the edge to it
+    #
+    # Returns the PathLink for this path extended with given Node
+    # (the same PathLink object is returned every time the same path is extended with the same Node)
+    def extend(self, node, edge_length):
+        link = self.children.get(node)
+        if not link:
+            link = PathLink(node, self, self.cost + edge_length)
+            self.children[node] = link
+        return link
+
+
+    # Returns an array with the PathLinks from the start Node up to, and including, this link
+    def getLinks(self):
+        links = [None] * (self.depth + 1)
+        link = self
+        while link:
+            links[link.depth] = link
+            link = link.parent
+        return links
+
+
+    # Takes the CompactGraph which the Node ids refer to
+    #
+    # Returns the path as an array of tuples of (x, y)-coordinates
+    def getCoords(self, compact):
+        xs, ys = compact.getLists()[:2]
+        return [(xs[link.node], ys[link.node]) for link in self.getLinks()]
+
+
+# Takes a CompactGraph, two Node ids for start and end point, and the desired number of shortest paths
+#
+# Returns an array of (at most k) PathLinks for the shortest loopless paths, in order of length (increasing)
+# (see iterShortestPaths())
+def yenShortestPaths(compact, start, end, k):
+    return list(islice(iterShortestPaths(compact, start, end), k))
+
+
+# Takes a CompactGraph, and two Node ids for start and end point
+#
+# Yen's algorithm: each new path is the shortest deviation ("spur") from a previously found path,
+# which leaves that path at some Node without using any edge already taken there by a found path,
+# and without revisiting any Node before the deviation (so that no loops are created)
+#
+# The paths are generated one at a time: the spur paths of a path are only searched for
+# when the next path is asked for, so asking for the next path only costs the extra search work
 #
-# If there is at least one Node with an out-edge in the right Direction (with respect to theta):
-#     Returns the closest Node which has an out-edge in the right Direction
+# Returns a generator of PathLinks for the shortest loopless paths, in order of length (increasing)
+def iterShortestPaths(compact, start, end):
+    root = PathLink(start, None, 0)
+
+    # Heap of candidate paths, as (cost, counter, PathLink, index of the Node where the path deviates)
+    # The counter makes sure that paths of equal length are popped in the order they were found
+    candidates = []
+    counter = 0
+    seen = set()
+
+    spur = aStar(compact, start, end)
+    if spur:
+        link = root
+        for node, edge_length in spur:
+            link = link.extend(node, edge_length)
+        heappush(candidates, (link.cost, counter, link, 0))
+        seen.add(link)
+
+    while candidates:
+        cost, _, tail, deviation = heappop(candidates)
+
+        links = tail.getLinks()
+        for i in range(len(links)-1):
+            links[i].accepted_next.add(links[i+1].node)
+
+        yield tail
+
+        # Nodes on the root path, which may not be visited again by a spur path
+        root_nodes = set(link.node for link in links[:deviation])
+
+        # Only deviating at or after the Node where this path deviated from its parent path,
+        # any earlier deviations have already been found
+        for i in range(deviation, len(links)-1):
+            spur_link = links[i]
+            spur = aStar(compact, spur_link.node, end, root_nodes, spur_link.accepted_next)
+            root_nodes.add(spur_link.node)
+
+            if spur:
+                link = spur_link
+                for node, edge_length in spur:
+                    link = link.extend(node, edge_length)
+                if link not in seen:
+                    counter += 1
+                    heappush(candidates, (link.cost, counter, link, i))
+                    seen.add(link)
+
+
+# Takes a CompactGraph, two Node ids for start and end point, a Set of Node ids that may not be visited (optional),
+# a Set of Node ids that may not be used as first step from the start Node (optional),
+# and an array with a cost for each edge to search with, instead of its length (optional, each at least the length)
+#
+# A* search, with the straight-line distance to the end Node as heuristic
+# (which never overestimates, since every edge is at least as long as the straight line between its Nodes)
+# Predecessors are kept as parent pointers, and the path is only built once the end Node has been reached
+#
+# If there is a path from the start Node to the end Node:
+#     Returns the shortest path as an array of tuples of (Node id, length of the edge to that Node),
+#     not including the start Node
 # Otherwise:
 #     Returns None
-def getClosestToVehicle(graph, vehicle_state):
-
-    # Used to specify search range for finding closest point
-    search_range = 100
-
-    # Normalizing theta
-    theta = degrees(vehicle_state.theta1) % 360
-    pos = Point(vehicle_state.x, vehicle_state.y)
-    nodes = graph.nodes.values()
-
-    # Vehicle angle: bottom-to-top
-    if theta > 225 and theta <= 315:
-        # Selecting all Nodes which are in range from the vehicle
-        nodes = getAllInRangeX(getAllInRangeY(nodes, pos, search_range, 0), pos, search_range)
-        # Selecting all Nodes which have an out-edge upwards from vehicle position
-        nodes = getAllInRightDir(nodes, pos, Direction.up)
-
-    # Vehicle angle: right-to-left
-    elif theta > 135 and theta <= 225:
-        # Selecting all Nodes which are in range from the vehicle
-        nodes = getAllInRangeX(getAllInRangeY(nodes, pos, search_range), pos, search_range, 0)
-        # Selecting all Nodes which have an out-edge to the left from vehicle position
-        nodes = getAllInRightDir(nodes, pos, Direction.left)
-
-    # Vehicle angle: top-to-bottom
-    elif theta > 45 and theta <= 135:
-        # Selecting all Nodes which are in range from the vehicle
-        nodes = getAllInRangeX(getAllInRangeY(nodes, pos, 0, search_range), pos, search_range)
-        # Selecting all Nodes which have an out-edge downwards from vehicle position
-        nodes = getAllInRightDir(nodes, pos, Direction.down)
-
-    # Vehicle angle: left-to-right
-    elif theta > 315 or theta <=45:
-        # Selecting all Nodes which are in range from the vehicle
-        nodes = getAllInRangeX(getAllInRangeY(nodes, pos, search_range), pos, 0, search_range)
-        # Selecting all Nodes which have an out-edge to the right from vehicle position
-        nodes = getAllInRightDir(nodes, pos, Direction.right)
+def aStar(compact, start, end, blocked_nodes=frozenset(), blocked_first=frozenset(), costs=None):
+    xs, ys, offsets, targets, lengths = compact.getLists()
+    blocked = compact.blocked
+    if costs is None:
+        costs = lengths
+    (end_x, end_y) = (xs[end], ys[end])
+
+    scratch = compact.acquireScratch()
+    (dist, parent, seen, done, epoch) = (scratch.dist, scratch.parent, scratch.seen, scratch.done, scratch.epoch)
+    node_heap = [(0, start)]
+    dist[start] = 0
+    parent[start] = -1
+    seen[start] = epoch
+    # Counters for the planner stats (see planner_stats.addSearch())
+    (expanded, pushes, pops, peak_heap) = (0, 1, 0, 1)
+
+    try:
+        while node_heap:
+            if len(node_heap) > peak_heap:
+                peak_heap = len(node_heap)
+            _, current = heappop(node_heap)
+            pops += 1
+            if done[current] == epoch:
+                continue
+            done[current] = epoch
+            expanded += 1
+
+            if current == end:
+                return getScratchPath(scratch, lengths, start, end)
+
+            cost = dist[current]
+            for edge in range(offsets[current], offsets[current+1]):
+                out_edge = targets[edge]
+                if done[out_edge] == epoch or out_edge in blocked_nodes or edge in blocked:
+                    continue
+                if current == start and out_edge in blocked_first:
+                    continue
+
+                new_cost = cost + costs[edge]
+                if seen[out_edge] != epoch or new_cost < dist[out_edge]:
+                    seen[out_edge] = epoch
+                    dist[out_edge] = new_cost
+                    parent[out_edge] = edge
+                    heuristic = sqrt((xs[out_edge] - end_x)**2 + (ys[out_edge] - end_y)**2)
+                    heappush(node_heap, (new_cost + heuristic, out_edge))
+                    pushes += 1
 
-    # Returning None if No Node is in range
-    if not nodes:
         return None
-        
-    # Finding the two Nodes which are closest to the vehicle, x-wise resp. y-wise
-    closest_x = getClosestX(nodes, pos)
-    closest_y = getClosestY(nodes, pos)
-    # Selecting the Node which is closest to the vehicle:
-    dx = Node(pos.x, pos.y).getEdgeLength(closest_x)
-    dy = Node(pos.x, pos.y).getEdgeLength(closest_y)
-    start_node = closest_x if dx <= dy else closest_y
-
-    return start_node
+
+    finally:
+        compact.releaseScratch(scratch)
+        addSearch(expanded, pushes, pops, peak_heap)
+
+
+# Takes a CompactGraph, a Node id for the start point, and a Set of Node ids for the end points
+#
+# Dijkstra search from the start Node, which stops once all end Nodes have been reached
+# (one search instead of one per end Node)
+#
+# Returns a Dictionary with the shortest path to each reachable end Node,
+# as an array of tuples of (Node id, length of the edge to that Node), not including the start Node
+def dijkstraToTargets(compact, start, ends):
+    offsets, targets, lengths = compact.getLists()[2:]
+    blocked = compact.blocked
+    remaining = set(ends)
+    paths = {}
+
+    scratch = compact.acquireScratch()
+    (dist, parent, seen, done, epoch) = (scratch.dist, scratch.parent, scratch.seen, scratch.done, scratch.epoch)
+    node_heap = [(0, start)]
+    dist[start] = 0
+    parent[start] = -1
+    seen[start] = epoch
+    # Counters for the planner stats (see planner_stats.addSearch())
+    (expanded, pushes, pops, peak_heap) = (0, 1, 0, 1)
+
+    try:
+        while node_heap and remaining:
+            if len(node_heap) > peak_heap:
+                peak_heap = len(node_heap)
+            cost, current = heappop(node_heap)
+            pops += 1
+            if done[current] == epoch:
+                continue
+            done[current] = epoch
+            expanded += 1
+
+            if current in remaining:
+                remaining.discard(current)
+                paths[current] = getScratchPath(scratch, lengths, start, current)
+
+            for edge in range(offsets[current], offsets[current+1]):
+                out_edge = targets[edge]
+                if done[out_edge] == epoch or edge in blocked:
+                    continue
+
+                new_cost = cost + lengths[edge]
+                if seen[out_edge] != epoch or new_cost < dist[out_edge]:
+                    seen[out_edge] = epoch
+                    dist[out_edge] = new_cost
+                    parent[out_edge] = edge
+                    heappush(node_heap, (new_cost, out_edge))
+                    pushes += 1
+
+        return paths
+
+    finally:
+        compact.releaseScratch(scratch)
+        addSearch(expanded, pushes, pops, peak_heap)
+
+
+# Takes a SearchScratch, the edge lengths of the CompactGraph, and two Node ids for start and end point
+#
+# Follows the parent edges in the SearchScratch back from the end Node to the start Node
+#
+# Returns the path as an array of tuples of (Node id, length of the edge to that Node), not including the start Node
+def getScratchPath(scratch, lengths, start, end):
+    sources = scratch.sources
+    parent = scratch.parent
+    path = []
+    current = end
+    while current != start:
+        edge = parent[current]
+        path.append((current, lengths[edge]))
+        current = sources[edge]
+    path.reverse()
+    return path
+
+
+# Takes a CompactGraph, two Node ids for start and end point, and the desired number of shortest paths
+#
+# Best-first search where Nodes may be visited more than once
+# Every path on the heap is a PathLink, so extending a path does not copy it
+#
+# Returns an array of (at most k) PathLinks for the shortest paths, in order of length (increasing)
+def kShortestWalks(compact, start, end, k):
+    offsets, targets, lengths = compact.getLists()[2:]
+    blocked = compact.blocked
+    path_heap = [(0, 0, PathLink(start, None, 0))]
+    paths = []
+    counter = 0
+    peak_heap = 1
+    pops = 0
+
+    while len(paths) < k and path_heap:
+        if len(path_heap) > peak_heap:
+            peak_heap = len(path_heap)
+        cost, _, link = heappop(path_heap)
+        pops += 1
+
+        # If the end Node has been reached, adding this path to the array of shortest paths
+        if link.node == end:
+            paths.append(link)
+
+        # Otherwise adding all possible paths forward from this Node to the path heap
+        else:
+            for edge in range(offsets[link.node], offsets[link.node+1]):
+                if edge in blocked:
+                    continue
+                counter += 1
+                new_link = PathLink(targets[edge], link, cost + lengths[edge])
+                heappush(path_heap, (new_link.cost, counter, new_link))
+
+    # Every popped path is expanded, except the paths found, and the counter is the number of pushes after the first one
+    addSearch(pops - len(paths), counter + 1, pops, peak_heap)
+    return paths
+
+
+# Used by getClosestToVehicle()
+SEARCH_RANGE = 100                  # Maximum distance (in cm) from the vehicle to the start Node
+HEADING_TOLERANCE = radians(45)     # Maximum angle between the vehicle heading and an out-edge of the start Node
+HEADING_WEIGHT = 50                 # Cost (in cm) of one radian between the vehicle heading and the out-edge
+
+
+# Takes a Graph, a VehicleState object, and the maximum angle (in radians)
+# between the vehicle heading and the start Node's out-edge (optional)
+#
+# If there is at least one Node in range, ahead of the vehicle, with an out-edge in the right direction:
+#     Returns the Node among them which is closest to the vehicle,
+#     where the angle between the vehicle heading and the out-edge counts as extra distance
+# Otherwise:
+#     Returns None
+def getClosestToVehicle(graph, vehicle_state, heading_tolerance=HEADING_TOLERANCE):
+    compact = graph.getCompact()
+    i = compact.getHeadingIndex().closestAligned(vehicle_state.x, vehicle_state.y, vehicle_state.theta1,
+                                                 SEARCH_RANGE, heading_tolerance, HEADING_WEIGHT)
+    return graph.getNodeById(i) if i is not None else None
+
+
+# Takes a Graph, a Point object and a search range
+#
+# If there is a Node at given Point, or at least one Node within the search range from given Point:
+#     Returns the Node which is closest to given Point
+# Otherwise:
+#     Returns None
+def getClosestNode(graph, point, search_range):
+    i = getClosestId(graph.getCompact(), point, search_range)
+    return graph.getNodeById(i) if i is not None else None
+
+
+# Takes a CompactGraph, a Point object and a search range
+#
+# A Node is in range if it is within the search range from given Point both x-wise and y-wise (a square),
+# and the closest one is picked by its (Euclidean) distance to given Point
+#
+# If there is a Node at given Point, or at least one Node within the search range from given Point:
+#     Returns the id of the Node which is closest to given Point
+# Otherwise:
+#     Returns None
+def getClosestId(compact, point, search_range):
+    return compact.getSpatialIndex().nearest(point.x, point.y, search_range * sqrt(2), search_range)
+
+
+# Takes a CompactGraph, arrays with (x, y)-coordinates and a search range
+#
+# Same as calling getClosestId() for each of the coordinates, but all coordinates are handled at once
+#
+# Returns a NumPy array with the id of the closest Node for each of the coordinates (-1 where No Node is in range)
+def getClosestIds(compact, xs, ys, search_range):
+    return compact.getSpatialIndex().nearestMany(xs, ys, search_range * sqrt(2), search_range)
+
+
+# Takes an array of Node objects and a Point object
+#
+# Returns the Node that is closest to given Point
+def getClosest(nodes, point):
+    closest_node = None
+    closest_dist = float('inf')
+
+    for node in nodes:
+        dist = (point.x - node.x)**2 + (point.y - node.y)**2
+        if dist < closest_dist:
+            closest_dist = dist
+            closest_node = node
+
+    return closest_node
 
 
 # Takes an array of Node objects, a Point object, and search range limits
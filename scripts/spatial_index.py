@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2017, Lars Niklasson
+Copyright (c) 2017, Filip Slottner Seholm
+Copyright (c) 2017, Fanny Sandblom
+Copyright (c) 2017, Kevin Hoogendijk
+Copyright (c) 2017, Nils Andren
+Copyright (c) 2017, Alicia Gil Martin
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the Chalmers University of Technology nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+import numpy as np
+from math import sqrt, floor, cos, sin, acos
+
+
+CELL_SIZE = 20  # Minimum side of a grid cell, in cm
+
+
+# For finding the Nodes of a CompactGraph that are close to a given position
+#
+# The Nodes are sorted into a uniform grid of square cells,
+# so a query only looks at the Nodes in the cells that overlap the search range
+#
+# The Nodes in cell c are 'ids[cell_start[c]:cell_start[c+1]]'
+class SpatialIndex:
+
+    # Takes arrays with the (x, y)-coordinates of the Nodes (indexed by Node id),
+    # and the minimum side of a grid cell (optional)
+    #
+    # The cells are made large enough to hold about one Node each on average,
+    # so the grid stays small even for large, sparse maps
+    def __init__(self, xs, ys, cell_size=CELL_SIZE):
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        n = len(xs)
+
+        if n > 0:
+            (self.x0, self.y0) = (float(xs.min()), float(ys.min()))
+            width = float(xs.max()) - self.x0
+            height = float(ys.max()) - self.y0
+        else:
+            (self.x0, self.y0, width, height) = (0.0, 0.0, 0.0, 0.0)
+
+        self.cell_size = float(max(cell_size, sqrt(width * height / max(n, 1))))
+        self.cols = int(width // self.cell_size) + 1
+        self.rows = int(height // self.cell_size) + 1
+
+        cells = self.getCells(xs, ys)
+        order = np.argsort(cells, kind='mergesort')
+        counts = np.bincount(cells, minlength=self.rows * self.cols)
+        cell_start = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=cell_start[1:])
+
+        self.ids = order.tolist()
+        self.cell_start = cell_start.tolist()
+        # The same arrays as NumPy arrays, for nearestMany()
+        self.id_array = order
+        self.cell_start_array = cell_start
+        self.coords = (xs, ys)
+        self.xs = xs.tolist()
+        self.ys = ys.tolist()
+
+
+    # Takes arrays with (x, y)-coordinates
+    #
+    # Returns an array with the index of the grid cell for each of the coordinates
+    # (coordinates outside the grid are clamped to the closest cell on the border)
+    def getCells(self, xs, ys):
+        cols = np.clip(((xs - self.x0) // self.cell_size).astype(np.int64), 0, self.cols-1)
+        rows = np.clip(((ys - self.y0) // self.cell_size).astype(np.int64), 0, self.rows-1)
+        return rows * self.cols + cols
+
+
+    # Takes (x, y)-coordinates and a search range
+    #
+    # Returns an array with the ids of all Nodes within the (Euclidean) search range from given coordinates
+    def inRadius(self, x, y, radius):
+        result = []
+        r2 = radius * radius
+        (xs, ys, ids, cell_start) = (self.xs, self.ys, self.ids, self.cell_start)
+
+        (col_min, col_max, row_min, row_max) = self.getCellRange(x - radius, y - radius, x + radius, y + radius)
+        for row in range(row_min, row_max+1):
+            for cell in range(row * self.cols + col_min, row * self.cols + col_max + 1):
+                for i in ids[cell_start[cell]:cell_start[cell+1]]:
+                    if (xs[i] - x)**2 + (ys[i] - y)**2 <= r2:
+                        result.append(i)
+
+        return result
+
+
+    # Takes (x, y)-coordinates, a maximum search range (optional),
+    # and half the side of a square around the coordinates, which the Node also has to be within (optional)
+    #
+    # If there is at least one Node within the search range (and the square):
+    #     Returns the id of the Node closest to given coordinates
+    # Otherwise:
+    #     Returns None
+    def nearest(self, x, y, max_dist=float('inf'), window=float('inf')):
+        best = None
+        best_d2 = max_dist * max_dist
+        (xs, ys, ids, cell_start) = (self.xs, self.ys, self.ids, self.cell_start)
+
+        (col, row) = (int(floor((x - self.x0) / self.cell_size)), int(floor((y - self.y0) / self.cell_size)))
+        (clamped_col, clamped_row) = (min(max(col, 0), self.cols-1), min(max(row, 0), self.rows-1))
+
+        # Number of rings needed to cover the whole grid, resp. the whole search range
+        outside = max(abs(col - clamped_col), abs(row - clamped_row))
+        max_ring = max(self.cols, self.rows)
+        if max_dist != float('inf'):
+            max_ring = min(max_ring, outside + int(max_dist // self.cell_size) + 1)
+        (col, row) = (clamped_col, clamped_row)
+
+        # Searching rings of cells around the cell of given coordinates,
+        # until no Node in a farther ring can be closer than the best one found
+        ring = 0
+        while ring <= max_ring:
+            for (r, c) in self.getRing(row, col, ring):
+                cell = r * self.cols + c
+                for i in ids[cell_start[cell]:cell_start[cell+1]]:
+                    if abs(xs[i] - x) > window or abs(ys[i] - y) > window:
+                        continue
+                    d2 = (xs[i] - x)**2 + (ys[i] - y)**2
+                    # Equally close Nodes are resolved in favour of the lowest id (as in nearestMany())
+                    if d2 < best_d2 or (d2 == best_d2 and (best is None or i < best)):
+                        best_d2 = d2
+                        best = i
+
+            # Distance from given coordinates to the closest point outside the searched cells
+            reach = min(x - (self.x0 + (col - ring) * self.cell_size),
+                        (self.x0 + (col + ring + 1) * self.cell_size) - x,
+                        y - (self.y0 + (row - ring) * self.cell_size),
+                        (self.y0 + (row + ring + 1) * self.cell_size) - y)
+            if reach > 0 and reach * reach >= best_d2:
+                break
+            ring += 1
+
+        return best
+
+
+    # Takes arrays with (x, y)-coordinates, a (finite) maximum search range,
+    # and half the side of a square around each of the coordinates, which its Node also has to be within (optional)
+    #
+    # Same as calling nearest() for each of the coordinates, but all coordinates are handled at once:
+    # every Node in the cells within the search range is paired with each coordinate,
+    # and the closest Node is picked among all pairs
+    #
+    # Returns an array with the id of the closest Node for each of the coordinates (-1 where No Node is in range)
+    def nearestMany(self, xs, ys, max_dist, window=float('inf')):
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        result = np.full(len(xs), -1, dtype=np.int64)
+        if len(xs) == 0 or len(self.id_array) == 0:
+            return result
+
+        cols = np.floor((xs - self.x0) / self.cell_size).astype(np.int64)
+        rows = np.floor((ys - self.y0) / self.cell_size).astype(np.int64)
+        reach = int(max_dist // self.cell_size) + 1
+
+        # Pairs of (index of coordinates, Node id), for all Nodes in the cells around each of the coordinates
+        pair_points = []
+        pair_ids = []
+        for dr in range(-reach, reach+1):
+            for dc in range(-reach, reach+1):
+                (r, c) = (rows + dr, cols + dc)
+                points = np.nonzero((r >= 0) & (r < self.rows) & (c >= 0) & (c < self.cols))[0]
+                cells = r[points] * self.cols + c[points]
+                starts = self.cell_start_array[cells]
+                counts = self.cell_start_array[cells+1] - starts
+                total = int(counts.sum())
+                if total == 0:
+                    continue
+
+                # Position of each pair within its cell, added to the start of the cell
+                first = np.cumsum(counts) - counts
+                within = np.arange(total) - np.repeat(first, counts)
+                pair_points.append(np.repeat(points, counts))
+                pair_ids.append(self.id_array[np.repeat(starts, counts) + within])
+
+        if not pair_points:
+            return result
+        pair_points = np.concatenate(pair_points)
+        pair_ids = np.concatenate(pair_ids)
+
+        d2 = (self.coords[0][pair_ids] - xs[pair_points])**2 + (self.coords[1][pair_ids] - ys[pair_points])**2
+        in_range = d2 <= max_dist * max_dist
+        if window != float('inf'):
+            in_range &= (np.abs(self.coords[0][pair_ids] - xs[pair_points]) <= window) & \
+                        (np.abs(self.coords[1][pair_ids] - ys[pair_points]) <= window)
+        (pair_points, pair_ids, d2) = (pair_points[in_range], pair_ids[in_range], d2[in_range])
+
+        # Sorting by coordinates, then distance, then Node id: the first pair for each of the coordinates is the closest
+        order = np.lexsort((pair_ids, d2, pair_points))
+        pair_points = pair_points[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = pair_points[1:] != pair_points[:-1]
+        result[pair_points[first]] = pair_ids[order][first]
+        return result
+
+
+    # Takes a bounding box (min x, min y, max x, max y)
+    #
+    # Returns the range of grid cells (min col, max col, min row, max row) that overlap the box
+    def getCellRange(self, x_min, y_min, x_max, y_max):
+        col_min = max(int(floor((x_min - self.x0) / self.cell_size)), 0)
+        col_max = min(int(floor((x_max - self.x0) / self.cell_size)), self.cols-1)
+        row_min = max(int(floor((y_min - self.y0) / self.cell_size)), 0)
+        row_max = min(int(floor((y_max - self.y0) / self.cell_size)), self.rows-1)
+        return (col_min, col_max, row_min, row_max)
+
+
+    # Takes the row and column of a grid cell, and a distance (in cells)
+    #
+    # Returns an array of (row, col) for all cells inside the grid
+    # which are exactly given distance away (in the max-norm) from given cell
+    def getRing(self, row, col, dist):
+        if dist == 0:
+            return [(row, col)]
+
+        cells = []
+        for c in range(max(col - dist, 0), min(col + dist, self.cols-1) + 1):
+            if row - dist >= 0:
+                cells.append((row - dist, c))
+            if row + dist < self.rows:
+                cells.append((row + dist, c))
+        for r in range(max(row - dist + 1, 0), min(row + dist - 1, self.rows-1) + 1):
+            if col - dist >= 0:
+                cells.append((r, col - dist))
+            if col + dist < self.cols:
+                cells.append((r, col + dist))
+        return cells
+
+
+# For finding the Node that is best suited as a start point for a vehicle,
+# i.e. a Node close to the vehicle, ahead of it, with an out-edge in the direction the vehicle is heading
+#
+# The directions of all out-edges are computed once, as unit vectors stored per Node,
+# and candidate Nodes are found through a SpatialIndex
+class HeadingIndex:
+
+    # Takes a SpatialIndex, and arrays with Node coordinates, CSR offsets and targets (as in CompactGraph)
+    def __init__(self, spatial_index, xs, ys, offsets, targets):
+        self.spatial_index = spatial_index
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        offsets = np.asarray(offsets)
+        targets = np.asarray(targets)
+
+        sources = np.repeat(np.arange(len(xs)), np.diff(offsets))
+        dxs = xs[targets] - xs[sources]
+        dys = ys[targets] - ys[sources]
+        lengths = np.hypot(dxs, dys)
+        # Edges without length have no direction
+        lengths[lengths == 0] = np.inf
+        (uxs, uys) = ((dxs / lengths).tolist(), (dys / lengths).tolist())
+        offsets = offsets.tolist()
+
+        self.directions = []
+        for i in range(len(xs)):
+            self.directions.append([(uxs[e], uys[e]) for e in range(offsets[i], offsets[i+1])
+                                    if uxs[e] != 0 or uys[e] != 0])
+
+
+    # Takes the (x, y)-coordinates and heading (theta, in radians) of a vehicle, a search range,
+    # the largest accepted angle (in radians) between the heading and an out-edge,
+    # and the weight (in cm per radian) of the angle compared to the distance to the vehicle
+    #
+    # A Node is a valid start point if it is within the search range, not behind the vehicle,
+    # and has an out-edge within the accepted angle from the heading
+    #
+    # If there is at least one valid start point:
+    #     Returns the id of the valid start point with the lowest (distance + weight * angle)
+    # Otherwise:
+    #     Returns None
+    def closestAligned(self, x, y, theta, search_range, tolerance, weight):
+        (hx, hy) = (cos(theta), sin(theta))
+        min_dot = cos(tolerance)
+        (xs, ys) = (self.spatial_index.xs, self.spatial_index.ys)
+
+        best = None
+        best_cost = float('inf')
+        for i in self.spatial_index.inRadius(x, y, search_range):
+            (dx, dy) = (xs[i] - x, ys[i] - y)
+
+            # Skipping Nodes behind the vehicle
+            if dx * hx + dy * hy < 0:
+                continue
+
+            # The out-edge which is best aligned with the heading
+            dot = max([ux * hx + uy * hy for (ux, uy) in self.directions[i]] or [-1.0])
+            if dot < min_dot:
+                continue
+
+            cost = sqrt(dx * dx + dy * dy) + weight * acos(min(dot, 1.0))
+            if cost < best_cost:
+                best_cost = cost
+                best = i
+
+        return best
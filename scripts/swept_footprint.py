@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2017, Lars Niklasson
+Copyright (c) 2017, Filip Slottner Seholm
+Copyright (c) 2017, Fanny Sandblom
+Copyright (c) 2017, Kevin Hoogendijk
+Copyright (c) 2017, Nils Andren
+Copyright (c) 2017, Alicia Gil Martin
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the Chalmers University of Technology nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+from path_array import PathArray, wrapAngles
+from math import hypot
+import numpy as np
+
+
+SAMPLE_SPACING = 5  # Distance (in cm) between the poses checked along a path
+
+# Number of circles covering the tractor resp. the trailer, along their length
+TRACTOR_CIRCLES = 4
+TRAILER_CIRCLES = 8
+
+
+# For representing the measurements of a truck, a tractor pulling one trailer
+#
+# All measurements are in cm (angles in radians), and are taken from the truck in use (there are No defaults)
+# Each body is a rectangle, placed relative to its axle: 'rear overhang' is the part of the body behind the axle
+# 'hitch_offset' is the distance from the rear axle of the tractor back to the hitch,
+# 'trailer_wheelbase' the distance from the hitch back to the axle of the trailer,
+# and 'max_articulation' the largest angle between tractor and trailer, before they hit each other
+#
+# 'lookahead' (optional) is the distance ahead on the path that the path follower of the truck steers towards
+# Such a path follower cuts the corners of a path instead of driving them exactly, so when it is given,
+# the poses along a path are averaged over 'lookahead' on each side before they are checked (see smoothPoses())
+# By default (0), the truck is checked on exactly the given path
+class TruckModel:
+
+    def __init__(self, tractor_length, tractor_width, tractor_rear_overhang, hitch_offset,
+                 trailer_length, trailer_width, trailer_rear_overhang, trailer_wheelbase, max_articulation,
+                 lookahead=0):
+        self.tractor_length = tractor_length
+        self.tractor_width = tractor_width
+        self.tractor_rear_overhang = tractor_rear_overhang
+        self.hitch_offset = hitch_offset
+        self.trailer_length = trailer_length
+        self.trailer_width = trailer_width
+        self.trailer_rear_overhang = trailer_rear_overhang
+        self.trailer_wheelbase = trailer_wheelbase
+        self.max_articulation = max_articulation
+        self.lookahead = lookahead
+
+
+# Takes a Map, an array of paths, where each path is an array of tuples of (x, y)-coordinates
+# (e.g. the paths from RefPath.getAltPaths()), a TruckModel,
+# the heading of the trailer (in radians) at the start of the paths
+# (optional, e.g. VehicleState.theta2, by default the trailer is in line with the tractor),
+# and the distance (in cm) between the poses to check (optional)
+#
+# The rear axle of the tractor follows each path (with its corners cut, if the TruckModel has a lookahead),
+# and the trailer follows the hitch (see getTrailerPoses())
+# Both bodies are covered by circles along their length, and the truck collides where the clearance of the Map
+# (the distance to the closest black element, see Map.clearance) at the center of a circle is less than its radius,
+# where a circle is outside the Map, or where the angle between tractor and trailer is larger than max_articulation
+# All poses of all paths are checked at once
+#
+# Returns a NumPy array with, for each path, the index of the last point on the path
+# before the first collision (-1 if the truck does Not collide along the path)
+def findCollisions(track, paths, truck, trailer_heading=None, spacing=SAMPLE_SPACING):
+    result = np.full(len(paths), -1, dtype=np.int64)
+    path_arrays = [PathArray(path) for path in paths]
+    checked = [i for (i, path) in enumerate(path_arrays) if len(path) >= 2]
+    if not checked:
+        return result
+
+    # The poses of the tractor along each path, padded to the same number of poses by repeating the last pose
+    samples = [np.append(np.arange(0, path_arrays[i].getLength(), spacing), path_arrays[i].getLength())
+               for i in checked]
+    count = max(len(distances) for distances in samples)
+    (xs, ys, headings) = (np.empty((len(checked), count)) for _ in range(3))
+    valid = np.zeros((len(checked), count), dtype=bool)
+    for (row, i) in enumerate(checked):
+        (points, path_headings) = path_arrays[i].interpolate(samples[row])
+        n = len(points)
+        (xs[row, :n], ys[row, :n], headings[row, :n]) = (points[:, 0], points[:, 1], path_headings)
+        (xs[row, n:], ys[row, n:], headings[row, n:]) = (points[-1, 0], points[-1, 1], path_headings[-1])
+        valid[row, :n] = True
+    (xs, ys, headings) = smoothPoses(xs, ys, headings, int(round(truck.lookahead / float(spacing))))
+
+    if trailer_heading is None:
+        trailer_heading = headings[:, 0]
+    (trailer_xs, trailer_ys, trailer_headings) = getTrailerPoses(xs, ys, headings, trailer_heading, truck)
+
+    collisions = hitsMap(track, xs, ys, headings, truck.tractor_length, truck.tractor_width,
+                         truck.tractor_rear_overhang, TRACTOR_CIRCLES)
+    collisions |= hitsMap(track, trailer_xs, trailer_ys, trailer_headings, truck.trailer_length,
+                          truck.trailer_width, truck.trailer_rear_overhang, TRAILER_CIRCLES)
+    collisions |= np.abs(wrapAngles(headings - trailer_headings)) > truck.max_articulation
+    collisions &= valid
+
+    for (row, i) in enumerate(checked):
+        if collisions[row].any():
+            distance = samples[row][int(np.argmax(collisions[row]))]
+            index = np.searchsorted(path_arrays[i].distances, distance, side='right') - 1
+            result[i] = min(int(index), len(path_arrays[i]) - 1)
+    return result
+
+
+# Takes a Map, an array of paths (see findCollisions()), a TruckModel,
+# and the heading of the trailer (in radians) at the start of the paths (optional)
+#
+# Returns an array of the given paths along which the truck does Not collide (in the same order)
+def filterPaths(track, paths, truck, trailer_heading=None):
+    collisions = findCollisions(track, paths, truck, trailer_heading)
+    return [path for (path, index) in zip(paths, collisions) if index < 0]
+
+
+# Takes arrays of shape (paths, poses) with the (x, y)-coordinates and headings of poses along paths,
+# and the number of poses to average over on each side of a pose
+#
+# Each position is replaced by the mean of the positions around it (the first and last pose are repeated
+# beyond the ends of a path), and each heading by the direction of the averaged positions at that pose
+# (a pose where the averaged positions do Not move keeps its heading)
+#
+# Returns arrays of shape (paths, poses) with the averaged (x, y)-coordinates and headings
+def smoothPoses(xs, ys, headings, window):
+    if window < 1 or xs.shape[1] < 2:
+        return (xs, ys, headings)
+
+    size = 2 * window + 1
+    averaged = []
+    for values in (xs, ys):
+        padded = np.pad(values, ((0, 0), (window + 1, window)), mode='edge')
+        sums = np.cumsum(padded, axis=1)
+        averaged.append((sums[:, size:] - sums[:, :-size]) / size)
+
+    (dxs, dys) = (np.gradient(values, axis=1) for values in averaged)
+    still = (dxs == 0) & (dys == 0)
+    return (averaged[0], averaged[1], np.where(still, headings, np.arctan2(dys, dxs)))
+
+
+# Takes arrays of shape (paths, poses) with the (x, y)-coordinates and headings of the rear axle of the tractor,
+# the heading of the trailer at the first pose (a number, or an array with one heading per path), and a TruckModel
+#
+# The axle of the trailer is pulled straight towards the hitch, keeping trailer_wheelbase from it
+# (the poses have to be close together for this to follow the path of a real trailer)
+#
+# Returns arrays of shape (paths, poses) with the (x, y)-coordinates and headings of the axle of the trailer
+def getTrailerPoses(xs, ys, headings, trailer_heading, truck):
+    wheelbase = truck.trailer_wheelbase
+    hitch_xs = xs - truck.hitch_offset * np.cos(headings)
+    hitch_ys = ys - truck.hitch_offset * np.sin(headings)
+
+    trailer_headings = np.empty(xs.shape)
+    trailer_headings[:, 0] = trailer_heading
+    # Only the pose before is needed for each pose, so the poses are computed for all paths at once, one pose at a time
+    (trailer_x, trailer_y) = (hitch_xs[:, 0] - wheelbase * np.cos(trailer_headings[:, 0]),
+                              hitch_ys[:, 0] - wheelbase * np.sin(trailer_headings[:, 0]))
+    for i in range(1, xs.shape[1]):
+        trailer_headings[:, i] = np.arctan2(hitch_ys[:, i] - trailer_y, hitch_xs[:, i] - trailer_x)
+        trailer_x = hitch_xs[:, i] - wheelbase * np.cos(trailer_headings[:, i])
+        trailer_y = hitch_ys[:, i] - wheelbase * np.sin(trailer_headings[:, i])
+
+    trailer_xs = hitch_xs - wheelbase * np.cos(trailer_headings)
+    trailer_ys = hitch_ys - wheelbase * np.sin(trailer_headings)
+    return (trailer_xs, trailer_ys, trailer_headings)
+
+
+# Takes a Map, arrays of shape (paths, poses) with the (x, y)-coordinates and headings of the axle of a body,
+# the length and width of the body, the length of the body behind the axle, and the number of circles to cover it with
+#
+# The body is covered by circles with centers evenly spaced along its length,
+# which are just large enough to cover the corners of their part of the body
+# Each center is checked in the element of the Map that contains it (rounding down, also for negative coordinates)
+#
+# Returns a Boolean array of shape (paths, poses), True where the body hits a black element or is outside the Map
+def hitsMap(track, xs, ys, headings, length, width, rear_overhang, circles):
+    offsets = -rear_overhang + (np.arange(circles) + 0.5) * length / float(circles)
+    radius = hypot(width / 2.0, length / (2.0 * circles))
+
+    center_xs = np.floor(xs[..., np.newaxis] + offsets * np.cos(headings)[..., np.newaxis]).astype(np.int64)
+    center_ys = np.floor(ys[..., np.newaxis] + offsets * np.sin(headings)[..., np.newaxis]).astype(np.int64)
+
+    (rows, cols) = track.clearance.shape
+    inside = (center_xs >= 0) & (center_xs < cols) & (center_ys >= 0) & (center_ys < rows)
+    clearance = track.clearance[np.clip(center_ys, 0, rows - 1), np.clip(center_xs, 0, cols - 1)]
+    return ((clearance < radius) | ~inside).any(axis=-1)
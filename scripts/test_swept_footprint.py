@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+Tests for the swept-footprint check, run with:
+
+    python test_swept_footprint.py
+
+Copyright (c) 2017, Lars Niklasson
+Copyright (c) 2017, Filip Slottner Seholm
+Copyright (c) 2017, Fanny Sandblom
+Copyright (c) 2017, Kevin Hoogendijk
+Copyright (c) 2017, Nils Andren
+Copyright (c) 2017, Alicia Gil Martin
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the Chalmers University of Technology nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+from map_func import getClearance
+from swept_footprint import TruckModel, findCollisions, filterPaths
+from math import radians
+import numpy as np
+import unittest
+
+
+# A truck with made-up measurements (in cm), only used on the track below
+TRUCK = TruckModel(tractor_length=26, tractor_width=16, tractor_rear_overhang=5, hitch_offset=1,
+                   trailer_length=30, trailer_width=16, trailer_rear_overhang=6, trailer_wheelbase=20,
+                   max_articulation=radians(80))
+
+
+# For representing a track with a straight corridor, in the same way as a Map (see 'map_func')
+#
+# The corridor runs along the x-axis, between black elements below y = 80 and from y = 120
+class Corridor:
+
+    def __init__(self):
+        self.matrix = np.ones((200, 300), dtype=np.uint8)
+        self.matrix[:80, :] = 0
+        self.matrix[120:, :] = 0
+        self.clearance = getClearance(self.matrix)
+
+
+class SweptFootprintTest(unittest.TestCase):
+
+    def setUp(self):
+        self.track = Corridor()
+
+
+    # Driving straight along the middle of the corridor, the truck (16 cm wide) keeps 12 cm from both walls
+    def testStraightPathDoesNotCollide(self):
+        path = [(60.0, 100.0), (150.0, 100.0), (250.0, 100.0)]
+        self.assertEqual(findCollisions(self.track, [path], TRUCK).tolist(), [-1])
+        self.assertEqual(filterPaths(self.track, [path], TRUCK), [path])
+
+
+    # Turning into the wall at x = 150, the front of the tractor hits it right after the second point
+    def testPathIntoWallCollides(self):
+        path = [(60.0, 100.0), (150.0, 100.0), (150.0, 180.0)]
+        self.assertEqual(findCollisions(self.track, [path], TRUCK).tolist(), [1])
+        self.assertEqual(filterPaths(self.track, [path], TRUCK), [])
+
+
+if __name__ == '__main__':
+    unittest.main()